@@ -0,0 +1,281 @@
+"""
+Benchmarks for the keyvalue store and the urlcaching paths.
+
+Runs insert, hit and miss scenarios for every combination of store size, node settings and thread count, followed
+by expiry sweeps, list_keys and open_url calls against a local stub client. Results are written as JSON so that
+two runs can be compared:
+    $ PYTHONPATH=src python benchmarks/bench_store.py --sizes 10000 100000 --threads 1 8 --output current.json
+    $ PYTHONPATH=src python benchmarks/bench_store.py --baseline current.json --output candidate.json
+
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from webscrapetools import keyvalue, urlcaching
+from webscrapetools.taskpool import TaskPool
+
+
+_RESULTS_FORMAT_VERSION = 1
+
+_logger = logging.getLogger('bench_store')
+
+
+def _percentile(sorted_values: Sequence[float], rank: float) -> float:
+    if not sorted_values:
+        return 0.
+
+    index = min(len(sorted_values) - 1, int(round(rank / 100. * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarize(name: str, latencies: List[float], wall_time: float, params: Dict) -> Dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    result = {
+        'scenario': name,
+        'params': params,
+        'operations': count,
+        'wall_seconds': wall_time,
+        'throughput_ops': count / wall_time if wall_time > 0. else 0.,
+        'latency_seconds': {
+            'mean': sum(latencies) / count if count else 0.,
+            'p50': _percentile(latencies, 50),
+            'p90': _percentile(latencies, 90),
+            'p99': _percentile(latencies, 99),
+            'max': latencies[-1] if count else 0.,
+        }
+    }
+    _logger.info('%s %s: %d ops in %0.3fs (%0.0f ops/s, p50 %0.6fs, p99 %0.6fs)', name, params, count, wall_time,
+                 result['throughput_ops'], result['latency_seconds']['p50'], result['latency_seconds']['p99'])
+    return result
+
+
+def _run_timed(operation: Callable[[str], object], keys: Sequence[str], threads: int) -> Tuple[List[float], float]:
+    """
+    Applies the operation to every key, spreading the keys over the specified number of threads.
+
+    :return: individual latencies and total wall time
+    """
+    latencies = list()
+
+    def run_chunk(chunk):
+        for key in chunk:
+            start = time.perf_counter()
+            operation(key)
+            latencies.append(time.perf_counter() - start)
+
+    chunks = [keys[offset::threads] for offset in range(threads)]
+    tasks = TaskPool(threads)
+    for chunk in chunks:
+        tasks.add_task(run_chunk, chunk)
+
+    start_wall = time.perf_counter()
+    for _ in tasks.execute():
+        pass
+
+    return latencies, time.perf_counter() - start_wall
+
+
+def _make_value(key: str, value_size: int) -> bytes:
+    return (key * (value_size // max(len(key), 1) + 1)).encode('utf-8')[:value_size]
+
+
+def bench_store(store_path: str, backend: str, size: int, max_node_files: int, rebalancing_limit: int, threads: int,
+                samples: int, value_size: int) -> List[Dict]:
+    params = {'backend': backend, 'size': size, 'max_node_files': max_node_files,
+              'rebalancing_limit': rebalancing_limit, 'threads': threads}
+    keyvalue.set_store_path(store_path, max_node_files=max_node_files, rebalancing_limit=rebalancing_limit,
+                            backend=backend)
+    keyvalue.empty_store()
+    keys = ['https://example.com/page?id={:08d}'.format(count) for count in range(size)]
+    results = list()
+
+    latencies, wall_time = _run_timed(lambda key: keyvalue.add_to_store(key, _make_value(key, value_size)),
+                                      keys, threads)
+    results.append(_summarize('insert', latencies, wall_time, params))
+
+    random_gen = random.Random(size)
+    hit_keys = [random_gen.choice(keys) for _ in range(samples)]
+    latencies, wall_time = _run_timed(keyvalue.retrieve_from_store, hit_keys, threads)
+    results.append(_summarize('hit', latencies, wall_time, params))
+
+    miss_keys = ['https://example.com/missing?id={:08d}'.format(count) for count in range(samples)]
+    latencies, wall_time = _run_timed(keyvalue.has_store_key, miss_keys, threads)
+    results.append(_summarize('miss', latencies, wall_time, params))
+
+    keyvalue.empty_store()
+    return results
+
+
+def bench_maintenance(store_path: str, backend: str, size: int, max_node_files: int, rebalancing_limit: int,
+                      value_size: int) -> List[Dict]:
+    params = {'backend': backend, 'size': size, 'max_node_files': max_node_files,
+              'rebalancing_limit': rebalancing_limit}
+    keyvalue.set_store_path(store_path, max_node_files=max_node_files, rebalancing_limit=rebalancing_limit,
+                            backend=backend)
+    keyvalue.empty_store()
+    for count in range(size):
+        key = 'https://example.com/page?id={:08d}'.format(count)
+        keyvalue.add_to_store(key, _make_value(key, value_size))
+
+    results = list()
+    start = time.perf_counter()
+    keyvalue.list_keys()
+    results.append(_summarize('list_keys', [time.perf_counter() - start], time.perf_counter() - start, params))
+
+    start = time.perf_counter()
+    keyvalue.set_store_path(store_path, max_node_files=max_node_files, rebalancing_limit=rebalancing_limit,
+                            expiry_days=1, backend=backend)
+    results.append(_summarize('expiry_scan', [time.perf_counter() - start], time.perf_counter() - start, params))
+
+    start = time.perf_counter()
+    keyvalue.invalidate_expired_entries(as_of_date=datetime.today() + timedelta(days=2))
+    results.append(_summarize('expiry_sweep', [time.perf_counter() - start], time.perf_counter() - start, params))
+
+    keyvalue.set_store_path(store_path, max_node_files=max_node_files, rebalancing_limit=rebalancing_limit,
+                            backend=backend)
+    keyvalue.empty_store()
+    return results
+
+
+def bench_open_url(store_path: str, samples: int, threads: int, value_size: int) -> List[Dict]:
+    params = {'size': samples, 'threads': threads}
+    urlcaching.set_cache_path(store_path, expiry_days=None)
+    urlcaching.empty_cache()
+    urlcaching.reset_client()
+
+    def stub_client():
+        return None
+
+    def stub_call(_, url):
+        return _make_value(url, value_size).decode('utf-8'), url
+
+    def open_stub_url(url):
+        return urlcaching.open_url(url, init_client_func=stub_client, call_client_func=stub_call)
+
+    urls = ['https://example.com/article/{:08d}'.format(count) for count in range(samples)]
+    results = list()
+    latencies, wall_time = _run_timed(open_stub_url, urls, threads)
+    results.append(_summarize('open_url_miss', latencies, wall_time, params))
+    latencies, wall_time = _run_timed(open_stub_url, urls, threads)
+    results.append(_summarize('open_url_hit', latencies, wall_time, params))
+    urlcaching.empty_cache()
+    urlcaching.reset_client()
+    return results
+
+
+def _result_id(result: Dict) -> str:
+    return result['scenario'] + ' ' + json.dumps(result['params'], sort_keys=True)
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """
+    Lists scenarios whose throughput dropped by more than the tolerance compared to the baseline run.
+
+    :param baseline: results previously saved by this script
+    :param current: results of the current run
+    :param tolerance: relative slowdown accepted, 0.2 meaning 20%
+    :return: descriptions of the regressions found
+    """
+    baseline_results = {_result_id(result): result for result in baseline['results']}
+    regressions = list()
+    for result in current['results']:
+        previous = baseline_results.get(_result_id(result))
+        if previous is None or previous['throughput_ops'] == 0.:
+            continue
+
+        ratio = result['throughput_ops'] / previous['throughput_ops']
+        if ratio < 1. - tolerance:
+            regressions.append('{}: {:0.0f} ops/s vs {:0.0f} ops/s ({:+0.1%})'.format(
+                _result_id(result), result['throughput_ops'], previous['throughput_ops'], ratio - 1.))
+
+    return regressions
+
+
+def main(args):
+    store_path = args.store_path
+    if store_path is None:
+        store_path = tempfile.mkdtemp(prefix='wst-bench-')
+
+    results = list()
+    try:
+        for backend in args.backends:
+            backend_path = store_path
+            if backend == 'sqlite':
+                backend_path = os.path.join(store_path, 'store.sqlite')
+
+            for size in args.sizes:
+                for max_node_files in args.max_node_files:
+                    for rebalancing_limit in args.rebalancing_limits:
+                        for threads in args.threads:
+                            results += bench_store(backend_path, backend, size, max_node_files, rebalancing_limit,
+                                                   threads, min(args.samples, size), args.value_size)
+
+                        results += bench_maintenance(backend_path, backend, size, max_node_files,
+                                                     rebalancing_limit, args.value_size)
+
+        for threads in args.threads:
+            results += bench_open_url(store_path, args.samples, threads, args.value_size)
+
+    finally:
+        if args.store_path is None:
+            shutil.rmtree(store_path, ignore_errors=True)
+
+    report = {
+        'format_version': _RESULTS_FORMAT_VERSION,
+        'created': datetime.utcnow().isoformat(),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'value_size': args.value_size,
+        'results': results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    _logger.info('results saved to %s', args.output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = compare_results(baseline, report, args.tolerance)
+        for regression in regressions:
+            _logger.error('regression: %s', regression)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    _logger.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description='Benchmarks for the keyvalue store and urlcaching',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['filesystem'], choices=['filesystem', 'memory', 'sqlite'],
+                        help='store backends')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='number of keys in the store, typically from 10000 up to 1000000')
+    parser.add_argument('--max-node-files', type=int, nargs='+', default=[0x100], help='max_node_files settings')
+    parser.add_argument('--rebalancing-limits', type=int, nargs='+', default=[0x200],
+                        help='rebalancing_limit settings')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8], help='thread counts')
+    parser.add_argument('--samples', type=int, default=2000, help='number of lookups for hit and miss scenarios')
+    parser.add_argument('--value-size', type=int, default=2048, help='size in bytes of stored values')
+    parser.add_argument('--store-path', help='store location, defaults to a temporary directory')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+    parser.add_argument('--baseline', help='previous JSON results to compare against, exits with 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='accepted relative throughput drop')
+    sys.exit(main(parser.parse_args()))
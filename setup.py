@@ -4,6 +4,8 @@ __version = '0.5.5'
 
 INSTALL_REQUIRE = ['requests>=2.20.0']
 
+EXTRAS_REQUIRE = {'xxhash': ['xxhash>=2.0.0']}
+
 setup(
     name='webscrapetools',
     version=__version,
@@ -18,5 +20,6 @@ setup(
     license='Apache',
     download_url='https://github.com/chris-ch/webscrapetools/webscrapetools/archive/{0}.tar.gz'.format(__version),
     install_requires=INSTALL_REQUIRE,
+    extras_require=EXTRAS_REQUIRE,
     zip_safe=True
 )
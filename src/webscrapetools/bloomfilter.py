@@ -0,0 +1,101 @@
+"""
+Bloom filter over store digests.
+A digest absent from the filter is definitely not stored, so that misses can be answered without touching the storage.
+Digests being hexadecimal hashes already, bit positions are derived from the digest itself by double hashing.
+"""
+import math
+import struct
+from typing import Iterable, Optional
+
+
+__all__ = ['BloomFilter']
+
+_HEADER_FORMAT = '>BQQBQ'
+_FORMAT_VERSION = 1
+
+
+class BloomFilter(object):
+
+    def __init__(self, capacity: int, error_rate: float=0.01):
+        """
+
+        :param capacity: number of digests the filter is sized for before its false positive rate degrades
+        :param error_rate: expected false positive rate at capacity
+        """
+        capacity = max(1, capacity)
+        self._capacity = capacity
+        size_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self._size_bits = max(8, size_bits)
+        self._hashes_count = max(1, int(round(self._size_bits / capacity * math.log(2))))
+        self._bits = bytearray((self._size_bits + 7) // 8)
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def count(self) -> int:
+        """
+        :return: number of digests added since the filter was created
+        """
+        return self._count
+
+    def is_full(self) -> bool:
+        return self._count > self._capacity
+
+    def _positions(self, digest: str) -> Iterable[int]:
+        half_length = len(digest) // 2
+        hash_1 = int(digest[:half_length], 16)
+        hash_2 = int(digest[half_length:], 16) | 1
+        for count in range(self._hashes_count):
+            yield (hash_1 + count * hash_2) % self._size_bits
+
+    def add(self, digest: str) -> None:
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+        self._count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        bits = self._bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+    @staticmethod
+    def from_digests(digests: Iterable[str], capacity: int, error_rate: float=0.01) -> 'BloomFilter':
+        bloom_filter = BloomFilter(capacity, error_rate)
+        for digest in digests:
+            bloom_filter.add(digest)
+
+        return bloom_filter
+
+    def to_bytes(self) -> bytes:
+        header = struct.pack(_HEADER_FORMAT, _FORMAT_VERSION, self._capacity, self._count, self._hashes_count,
+                             self._size_bits)
+        return header + bytes(self._bits)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> Optional['BloomFilter']:
+        """
+        :param data: output of to_bytes()
+        :return: filter or None if data are not readable
+        """
+        header_size = struct.calcsize(_HEADER_FORMAT)
+        if data is None or len(data) < header_size:
+            return None
+
+        version, capacity, count, hashes_count, size_bits = struct.unpack_from(_HEADER_FORMAT, data)
+        if version != _FORMAT_VERSION or len(data) - header_size != (size_bits + 7) // 8:
+            return None
+
+        bloom_filter = BloomFilter.__new__(BloomFilter)
+        bloom_filter._capacity = capacity
+        bloom_filter._size_bits = size_bits
+        bloom_filter._hashes_count = hashes_count
+        bloom_filter._bits = bytearray(data[header_size:])
+        bloom_filter._count = count
+        return bloom_filter
@@ -1,28 +1,339 @@
+import atexit
+import bz2
+import functools
+import gzip
 import hashlib
 import itertools
+import json
 import logging
+import lzma
+import struct
 import threading
-from typing import Tuple, Iterable, List, MutableSequence, Callable
+import time
+from contextlib import contextmanager
+from typing import Tuple, Iterable, Callable, Union, Optional, List, Dict, BinaryIO, Iterator
 
-from webscrapetools import osaccess
+from webscrapetools import metrics
+from webscrapetools.bloomfilter import BloomFilter
+from webscrapetools.storage import StoreBackend, create_backend
 from datetime import datetime, timedelta
 
+try:
+    import xxhash
+
+except ImportError:
+    xxhash = None
+
 
 __all__ = ['set_store_path', 'invalidate_expired_entries', 'is_store_enabled', 'has_store_key', 'get_store_id',
-           'add_to_store', 'retrieve_from_store', 'remove_from_store', 'empty_store', 'list_keys']
+           'add_to_store', 'retrieve_from_store', 'remove_from_store', 'empty_store', 'list_keys', 'verify_store',
+           'rebuild_store', 'has_store_keys', 'export_store', 'import_store', 'evict_entries',
+           'retrieve_fresh_from_store']
 
 __rebalancing = threading.Condition()
-__STORE_INDEX_NAME = 'index'
-__STORE_PATH = None
+__STORE_BACKEND = None
+__KEY_FILTER = None
+__KEY_FILTER_META = 'filter'
+__KEY_FILTER_MIN_CAPACITY = 0x1000
+__INDEX_SNAPSHOT = None
+__INDEX_SNAPSHOT_META = 'snapshot'
+__STORE_FORMAT_META = 'format'
+__STORE_FORMAT_VERSION = 2
+__KEY_HASH = 'md5'
+__DEFAULT_KEY_HASH = 'md5'
+__DIGEST_MEMO_SIZE = 0x400
+__CONTENT_ADDRESSED = False
+__CONTENT_REFCOUNTS = dict()
+__CONTENT_REFCOUNTS_META = 'refcounts'
+__ACCESS_STATS = None
+__ACCESS_STATS_META = 'access'
+__ACCESS_JOURNAL_META = 'access-journal'
+__UNSAVED_ACCESSES = 0
+__JOURNALED_ACCESSES = 0
+__REFRESHES_META = 'refreshes'
+__UNSAVED_REFRESHES = 0
+__MAX_BYTES = None
+__MAX_ENTRIES = None
+__EVICTION_POLICY = 'lru'
+__EVICTION_TARGET_RATIO = 0.9
 __EXPIRY_PERIODS = None
 __EXPIRY_UNIT = None
+__STALE_PERIODS = None
 __MAX_NODE_FILES = 0x100
 __REBALANCING_LIMIT = 0x200
 
+_ARCHIVE_MAGIC = b'WSTSTORE'
+_ARCHIVE_VERSION = 1
+_ARCHIVE_HEADER = struct.Struct('>8sBI')
+_ARCHIVE_RECORD = struct.Struct('>8s32sIQ')
+_ARCHIVE_RECORD_MARKER = b'R'
+_ARCHIVE_END_MARKER = b'E'
+_ARCHIVE_CHUNK_SIZE = 1000
+_ARCHIVE_COMPRESSIONS = {'gzip': gzip.open, 'bz2': bz2.open, 'lzma': lzma.open}
+_ARCHIVE_COMPRESSION_MAGICS = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'lzma'))
+
+_METRIC_ADD = metrics.histogram('webscrapetools_store_add_seconds', 'Time spent in add_to_store')
+_METRIC_RETRIEVE = metrics.histogram('webscrapetools_store_retrieve_seconds', 'Time spent in retrieve_from_store')
+_METRIC_LOCK_WAIT = metrics.histogram('webscrapetools_store_lock_wait_seconds',
+                                      'Time spent waiting on the store rebalancing lock')
+_METRIC_REBALANCE = metrics.histogram('webscrapetools_store_rebalance_seconds',
+                                      'Duration of store tree rebalancing runs')
+_METRIC_NODE_SPLITS = metrics.counter('webscrapetools_store_node_splits_total',
+                                      'Number of store nodes divided while rebalancing')
+_METRIC_FILTER_NEGATIVES = metrics.counter('webscrapetools_store_filter_negatives_total',
+                                           'Store lookups answered by the key filter without accessing the storage')
+_METRIC_EVICTIONS = metrics.counter('webscrapetools_store_evictions_total',
+                                    'Entries removed from the store for keeping it within its quota')
+
+
+def _get_backend() -> StoreBackend:
+    global __STORE_BACKEND
+    return __STORE_BACKEND
+
+
+class _IndexSnapshot(object):
+    """
+    Compact summary of the index: number of entries, number of entries per date, last entry and time it was saved.
+    Persisted alongside the index, only entries added after the last one it accounts for need to be read at startup.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.dates = dict()
+        self.last_position = None
+        self.last_digest = None
+        self.saved_at = None
+
+    def add(self, position: int, entry: Tuple[str, str, str]) -> None:
+        date_str, digest, _ = entry
+        self.count += 1
+        self.dates[date_str] = self.dates.get(date_str, 0) + 1
+        self.last_position = position
+        self.last_digest = digest
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({'count': self.count, 'dates': self.dates, 'last_position': self.last_position,
+                           'last_digest': self.last_digest, 'saved_at': self.saved_at}).encode('utf-8')
+
+    @staticmethod
+    def from_bytes(data: Optional[bytes]) -> Optional['_IndexSnapshot']:
+        if data is None:
+            return None
+
+        try:
+            fields = json.loads(data.decode('utf-8'))
+            snapshot = _IndexSnapshot()
+            snapshot.count = int(fields['count'])
+            snapshot.dates = {str(date_str): int(count) for date_str, count in fields['dates'].items()}
+            snapshot.last_position = fields['last_position']
+            snapshot.last_digest = fields['last_digest']
+            snapshot.saved_at = fields.get('saved_at')
+
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+        return snapshot
+
+
+class _AccessStats(object):
+    """
+    Last access time, number of hits, value size and time the value was stored for every digest of the index, used for
+    evicting the coldest entries once the store exceeds its quota and for telling stale entries. Persisted alongside the
+    index snapshot, statistics of the entries changed since then being appended to a journal as records of the same
+    format.
+    """
+
+    _HEADER = struct.Struct('>BQ')
+    _RECORD = struct.Struct('>16sdIqd')
+    _VERSION = 2
+    _POLICIES = {
+        'lru': lambda stats: (stats[0], stats[1]),
+        'lfu': lambda stats: (stats[1], stats[0]),
+    }
+
+    def __init__(self):
+        # digest -> [last access timestamp, hits, size or None when unknown, stored timestamp]
+        self.entries = dict()
+        self.total_bytes = 0
+        self.unsized = set()
+        # digests changed since the statistics were last persisted
+        self.changed = set()
+
+    @property
+    def count(self) -> int:
+        return len(self.entries)
+
+    def record(self, digest: str, size: Optional[int], timestamp: float) -> None:
+        """
+        Value saved for the digest, hits being kept when the value is updated.
+        """
+        stats = self.entries.get(digest)
+        if stats is None:
+            stats = [timestamp, 0, None, timestamp]
+            self.entries[digest] = stats
+
+        stats[0] = timestamp
+        stats[3] = timestamp
+        self.set_size(digest, size)
+        self.changed.add(digest)
+
+    def advance(self, digest: str, timestamp: float) -> None:
+        """
+        Value known to be stored and accessed no earlier than the specified time.
+        """
+        stats = self.entries.get(digest)
+        if stats is not None:
+            stats[0] = max(stats[0], timestamp)
+            stats[3] = max(stats[3], timestamp)
+            self.changed.add(digest)
+
+    def stored_at(self, digest: str) -> Optional[float]:
+        stats = self.entries.get(digest)
+        if stats is None:
+            return None
+
+        return stats[3]
+
+    def touch(self, digest: str, timestamp: float) -> None:
+        stats = self.entries.get(digest)
+        if stats is not None:
+            stats[0] = timestamp
+            stats[1] += 1
+            self.changed.add(digest)
+
+    def set_size(self, digest: str, size: Optional[int]) -> None:
+        stats = self.entries[digest]
+        if stats[2] is not None:
+            self.total_bytes -= stats[2]
+
+        stats[2] = size
+        if size is None:
+            self.unsized.add(digest)
+
+        else:
+            self.total_bytes += size
+            self.unsized.discard(digest)
+
+        self.changed.add(digest)
+
+    def discard(self, digest: str) -> None:
+        stats = self.entries.pop(digest, None)
+        if stats is not None:
+            if stats[2] is not None:
+                self.total_bytes -= stats[2]
+
+            self.unsized.discard(digest)
+            self.changed.discard(digest)
+
+    def reconcile(self, entries: Iterable[Tuple[str, str, str]]) -> None:
+        """
+        Keeps statistics for the specified index entries only, entries not tracked yet being considered last accessed
+        on the day they were added.
+        """
+        digests = set()
+        for date_str, digest, _ in entries:
+            digests.add(digest)
+            if digest not in self.entries:
+                self.record(digest, None, _key_date_parse(date_str).timestamp())
+
+        for digest in [digest for digest in self.entries if digest not in digests]:
+            self.discard(digest)
+
+    def coldest(self, policy: str, count_entries: int, count_bytes: int) -> List[str]:
+        """
+        :param policy: one of ('lru', 'lfu')
+        :param count_entries: minimum number of entries to select
+        :param count_bytes: minimum number of bytes to select
+        :return: digests of the coldest entries according to the policy
+        """
+        sort_key = self._POLICIES[policy]
+        selected = list()
+        selected_bytes = 0
+        for digest, stats in sorted(self.entries.items(), key=lambda item: sort_key(item[1])):
+            if len(selected) >= count_entries and selected_bytes >= count_bytes:
+                break
+
+            selected.append(digest)
+            selected_bytes += stats[2] or 0
+
+        return selected
+
+    def to_records(self, digests: Iterable[str]) -> bytes:
+        records = list()
+        for digest in digests:
+            last_access, hits, size, stored = self.entries[digest]
+            records.append(self._RECORD.pack(bytes.fromhex(digest), last_access, min(hits, 0xFFFFFFFF),
+                                             -1 if size is None else size, stored))
+
+        return b''.join(records)
+
+    def to_bytes(self) -> bytes:
+        return self._HEADER.pack(self._VERSION, self.count) + self.to_records(self.entries)
+
+    def load_records(self, data: bytes) -> int:
+        """
+        Applies records persisted earlier, an incomplete last record left by an interrupted write being ignored.
+
+        :param data: records as created by to_records()
+        :return: number of records applied
+        """
+        record = self._RECORD
+        count_records = len(data) // record.size
+        for digest, last_access, hits, size, stored in record.iter_unpack(data[:count_records * record.size]):
+            stats = self.entries.setdefault(digest.hex(), [last_access, hits, None, stored])
+            stats[0], stats[1], stats[3] = last_access, hits, stored
+            self.set_size(digest.hex(), None if size < 0 else size)
+
+        self.changed.clear()
+        return count_records
+
+    @staticmethod
+    def from_bytes(data: Optional[bytes]) -> Optional['_AccessStats']:
+        header = _AccessStats._HEADER
+        record = _AccessStats._RECORD
+        if data is None or len(data) < header.size:
+            return None
+
+        version, count = header.unpack_from(data)
+        if version != _AccessStats._VERSION or len(data) != header.size + count * record.size:
+            return None
+
+        access_stats = _AccessStats()
+        access_stats.load_records(data[header.size:])
+        return access_stats
+
+
+def _get_key_filter() -> BloomFilter:
+    global __KEY_FILTER
+    return __KEY_FILTER
+
+
+def _get_index_snapshot() -> _IndexSnapshot:
+    global __INDEX_SNAPSHOT
+    return __INDEX_SNAPSHOT
+
+
+def _get_access_stats() -> _AccessStats:
+    global __ACCESS_STATS
+    return __ACCESS_STATS
+
+
+def _get_key_hash() -> str:
+    global __KEY_HASH
+    return __KEY_HASH
+
+
+def _is_content_addressed() -> bool:
+    global __CONTENT_ADDRESSED
+    return __CONTENT_ADDRESSED
+
 
 def _get_store_path():
-    global __STORE_PATH
-    return __STORE_PATH
+    backend = _get_backend()
+    if backend is None:
+        return None
+
+    return backend.store_path
 
 
 def _get_expiry() -> Tuple[int, str]:
@@ -31,12 +342,28 @@ def _get_expiry() -> Tuple[int, str]:
     return __EXPIRY_PERIODS, __EXPIRY_UNIT
 
 
+def _get_stale_periods() -> Optional[int]:
+    global __STALE_PERIODS
+    return __STALE_PERIODS
+
+
+def _is_access_tracked() -> bool:
+    """
+    Access statistics are only kept when needed, for evicting entries above a quota or for telling stale entries.
+    """
+    max_bytes, max_entries, _ = _get_quota()
+    return max_bytes is not None or max_entries is not None or _get_stale_periods() is not None
+
+
 def _get_max_node_files() -> int:
     global __MAX_NODE_FILES
     return __MAX_NODE_FILES
 
 
-def set_store_path(store_path, max_node_files=None, rebalancing_limit=None, expiry_days=None, expiry_periods=None, expiry_unit=None):
+def set_store_path(store_path, max_node_files=None, rebalancing_limit=None, expiry_days=None, expiry_periods=None,
+                   expiry_unit=None, backend: Union[str, StoreBackend]='filesystem', content_addressed: bool=None,
+                   max_bytes: int=None, max_entries: int=None, eviction_policy: str='lru', key_hash: str=None,
+                   stale_periods: int=None):
     """
     Required for enabling caching.
 
@@ -46,13 +373,38 @@ def set_store_path(store_path, max_node_files=None, rebalancing_limit=None, expi
     :param expiry_periods: number of periods in expiry_unit before removing from cache
     :param expiry_unit: one of ('day', 'seconds')
     :param expiry_days: number of days before purging from cache, defaults expiry_unit to 'day'
+    :param backend: one of ('filesystem', 'memory', 'sqlite'), store_path being the database file for the sqlite
+    backend, or an already configured StoreBackend instance in which case store_path is ignored
+    :param content_addressed: storing identical values only once, keys referring to a hash of their value; can only
+    be changed on an empty store, defaults to the mode the store was created with
+    :param max_bytes: total size of the values above which the coldest entries are evicted, unlimited if None
+    :param max_entries: number of entries above which the coldest entries are evicted, unlimited if None
+    :param eviction_policy: one of ('lru', 'lfu'), evicting least recently or least frequently retrieved entries first
+    :param key_hash: one of ('md5', 'blake2b', 'xxh128'), function hashing keys into digests, 'xxh128' being the
+    fastest but requiring the xxhash package; can only be changed on an empty store, defaults to the hash the store was
+    created with
+    :param stale_periods: number of periods in expiry_unit during which expired entries are kept in the store as stale,
+    instead of being removed, so that they can be served while being refreshed
     :return:
     """
-    global __STORE_PATH
+    global __STORE_BACKEND
     global __MAX_NODE_FILES
     global __REBALANCING_LIMIT
     global __EXPIRY_PERIODS
     global __EXPIRY_UNIT
+    global __MAX_BYTES
+    global __MAX_ENTRIES
+    global __EVICTION_POLICY
+    global __STALE_PERIODS
+
+    if eviction_policy not in _AccessStats._POLICIES:
+        raise ValueError('unknown eviction policy "{}", expected one of {}'.format(eviction_policy,
+                                                                                  sorted(_AccessStats._POLICIES)))
+
+    __MAX_BYTES = max_bytes
+    __MAX_ENTRIES = max_entries
+    __EVICTION_POLICY = eviction_policy
+    __STALE_PERIODS = stale_periods
 
     if not expiry_periods and not expiry_unit:
         __EXPIRY_UNIT = 'day'
@@ -62,56 +414,462 @@ def set_store_path(store_path, max_node_files=None, rebalancing_limit=None, expi
         __EXPIRY_UNIT = expiry_unit
         __EXPIRY_PERIODS = expiry_periods
 
-
     if max_node_files is not None:
         __MAX_NODE_FILES = max_node_files
 
     if rebalancing_limit is not None:
         __REBALANCING_LIMIT = rebalancing_limit
 
-    __STORE_PATH = osaccess.create_path_if_not_exists(store_path)
-    logging.debug('setting store path: %s', __STORE_PATH)
+    if isinstance(backend, StoreBackend):
+        store_backend = backend
+        store_backend.open()
+
+    else:
+        store_backend = create_backend(backend, store_path)
+
+    with _store_lock():
+        if __STORE_BACKEND is not None and __STORE_BACKEND is not store_backend:
+            _release_index_state()
+            __STORE_BACKEND.close()
+
+        __STORE_BACKEND = store_backend
+        _load_index_state()
+        _load_store_format(content_addressed, key_hash)
+
+    logging.debug('setting store path: %s', store_backend.store_path)
     invalidate_expired_entries()
+    evict_entries()
 
 
-def invalidate_expired_entries(as_of_date: datetime=None) -> None:
+def _save_store_format() -> None:
+    backend = _get_backend()
+    store_format = {'version': __STORE_FORMAT_VERSION, 'content_addressed': _is_content_addressed(),
+                    'key_hash': _get_key_hash()}
+    is_default_format = not store_format['content_addressed'] and store_format['key_hash'] == __DEFAULT_KEY_HASH
+    if backend.load_meta(__STORE_FORMAT_META) is not None or not is_default_format:
+        backend.save_meta(__STORE_FORMAT_META, json.dumps(store_format).encode('utf-8'))
+
+
+def _load_store_format(content_addressed: Optional[bool], key_hash: Optional[str]) -> None:
     """
-    :param as_of_date: fake current date (for dev only)
+    Loads settings the store was created with, the defaults applying to stores without saved format. Version 1 stores
+    predate the choice of key hash, always md5.
+
+    :param content_addressed: requested mode, None for keeping the existing one
+    :param key_hash: requested key hash, None for keeping the existing one
     :return:
     """
-    expiry_periods, expiry_unit = _get_expiry()
-    if not expiry_periods:
-        return
+    global __CONTENT_ADDRESSED
+    global __KEY_HASH
+    data = _get_backend().load_meta(__STORE_FORMAT_META)
+    store_format = json.loads(data.decode('utf-8')) if data else dict()
+    if store_format.get('version', 1) > __STORE_FORMAT_VERSION:
+        raise ValueError('unsupported store format version: {}'.format(store_format['version']))
+
+    store_content_addressed = bool(store_format.get('content_addressed', False))
+    store_key_hash = store_format.get('key_hash', __DEFAULT_KEY_HASH)
+    is_empty_store = _get_index_snapshot().count == 0
+    if content_addressed is not None and content_addressed != store_content_addressed:
+        if not is_empty_store:
+            raise ValueError('store already holds entries with content_addressed={}'.format(store_content_addressed))
+
+        store_content_addressed = content_addressed
+
+    if key_hash is not None and key_hash != store_key_hash:
+        if not is_empty_store:
+            raise ValueError('store already holds entries with key_hash={}'.format(store_key_hash))
+
+        store_key_hash = key_hash
+
+    _get_hash_function(store_key_hash)
+    __CONTENT_ADDRESSED = store_content_addressed
+    __KEY_HASH = store_key_hash
+    _save_store_format()
+    _load_content_refcounts()
+
+
+def _load_content_refcounts() -> None:
+    """
+    Reference counts are journaled as lines of "<content digest> <delta>", compacted on removals.
+
+    :return:
+    """
+    global __CONTENT_REFCOUNTS
+    refcounts = dict()
+    count_lines = 0
+    if _is_content_addressed():
+        journal = _get_backend().load_meta(__CONTENT_REFCOUNTS_META) or b''
+        for line in journal.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+
+            content_digest, delta = line.split(' ')
+            refcounts[content_digest] = refcounts.get(content_digest, 0) + int(delta)
+            count_lines += 1
+
+    __CONTENT_REFCOUNTS = {content_digest: count for content_digest, count in refcounts.items() if count > 0}
+    if count_lines > 2 * len(__CONTENT_REFCOUNTS):
+        _save_content_refcounts()
+
+
+def _save_content_refcounts() -> None:
+    lines = ''.join('{} {}\n'.format(content_digest, count) for content_digest, count in __CONTENT_REFCOUNTS.items())
+    _get_backend().save_meta(__CONTENT_REFCOUNTS_META, lines.encode('utf-8'))
+
+
+def _update_content_refcount(content_digest: str, delta: int) -> int:
+    """
+    :return: updated count of keys referring to the content
+    """
+    count = __CONTENT_REFCOUNTS.get(content_digest, 0) + delta
+    if count > 0:
+        __CONTENT_REFCOUNTS[content_digest] = count
+
+    else:
+        __CONTENT_REFCOUNTS.pop(content_digest, None)
+
+    _get_backend().append_meta(__CONTENT_REFCOUNTS_META, '{} {}\n'.format(content_digest, delta).encode('utf-8'))
+    return count
+
+
+def _build_key_filter(digests: Iterable[str], count_digests: int) -> BloomFilter:
+    capacity = max(__KEY_FILTER_MIN_CAPACITY, 2 * count_digests)
+    return BloomFilter.from_digests(digests, capacity)
+
+
+def _save_index_state(compact: bool=False) -> None:
+    """
+    :param compact: rewriting the whole access statistics instead of journaling the changed ones
+    :return:
+    """
+    backend = _get_backend()
+    snapshot = _get_index_snapshot()
+    snapshot.saved_at = time.time()
+    backend.save_meta(__INDEX_SNAPSHOT_META, snapshot.to_bytes())
+    backend.save_meta(__KEY_FILTER_META, _get_key_filter().to_bytes())
+    _save_access_stats(compact)
+
 
-    index_name = _fileindex_name()
+def _save_access_stats(compact: bool=False) -> None:
+    """
+    Appends statistics of the entries changed since last saved to the access journal, the whole statistics being
+    rewritten instead once the journals would hold more records than there are entries.
 
-    if not osaccess.exists_path(index_name):
+    :param compact: rewriting the whole statistics in any case
+    :return:
+    """
+    global __JOURNALED_ACCESSES
+    global __UNSAVED_REFRESHES
+    access_stats = _get_access_stats()
+    if not access_stats.changed and not compact:
         return
 
+    backend = _get_backend()
+    count_journaled = __JOURNALED_ACCESSES + __UNSAVED_REFRESHES + len(access_stats.changed)
+    if compact or count_journaled > access_stats.count:
+        backend.save_meta(__ACCESS_STATS_META, access_stats.to_bytes())
+        backend.save_meta(__ACCESS_JOURNAL_META, b'')
+        __JOURNALED_ACCESSES = 0
+        if __UNSAVED_REFRESHES > 0:
+            # journaled refreshes now part of the saved access statistics
+            backend.save_meta(__REFRESHES_META, b'')
+            __UNSAVED_REFRESHES = 0
+
+    else:
+        backend.append_meta(__ACCESS_JOURNAL_META, access_stats.to_records(access_stats.changed))
+        __JOURNALED_ACCESSES += len(access_stats.changed)
+
+    access_stats.changed.clear()
+
+
+def _journal_refresh(digest: str, timestamp: float) -> None:
+    """
+    Index dates being those of the first addition of keys, times at which values are refreshed are journaled as lines
+    of "<digest> <timestamp>" until the access statistics are saved, so that they survive a crash.
+
+    :param digest:
+    :param timestamp:
+    :return:
+    """
+    global __UNSAVED_REFRESHES
+    _get_backend().append_meta(__REFRESHES_META, '{} {!r}\n'.format(digest, timestamp).encode('utf-8'))
+    __UNSAVED_REFRESHES += 1
+
+
+def _load_refreshes(access_stats: _AccessStats) -> int:
+    """
+    :param access_stats: statistics the journaled refreshes are applied to
+    :return: number of journaled refreshes
+    """
+    journal = _get_backend().load_meta(__REFRESHES_META) or b''
+    count_refreshes = 0
+    for line in journal.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+
+        digest, timestamp = line.split(' ')
+        access_stats.advance(digest, float(timestamp))
+        count_refreshes += 1
+
+    return count_refreshes
+
+
+def _track_access() -> bool:
+    """
+    Counts additions and retrievals since the access statistics were last saved, independently of the number of
+    entries.
+
+    :return: True when the access statistics are due for being saved
+    """
+    global __UNSAVED_ACCESSES
+    __UNSAVED_ACCESSES += 1
+    if __UNSAVED_ACCESSES < __REBALANCING_LIMIT:
+        return False
+
+    __UNSAVED_ACCESSES = 0
+    return True
+
+
+def _release_index_state() -> None:
+    """
+    Saves the index state before the store is released, failures being only logged as the store may have been removed
+    in the meantime.
+
+    :return:
+    """
+    try:
+        _save_index_state()
+
+    except OSError as error:
+        logging.warning('failed saving index state of store %s: %s', _get_store_path(), error)
+
+
+def _save_index_state_at_exit() -> None:
+    if is_store_enabled() and _get_access_stats().changed:
+        with _store_lock():
+            _release_index_state()
+
+
+atexit.register(_save_index_state_at_exit)
+
+
+def _read_index_tail(snapshot: _IndexSnapshot) -> Optional[List[Tuple[int, Tuple[str, str, str]]]]:
+    """
+    :param snapshot:
+    :return: index entries added after the snapshot was taken or None if the index does not match the snapshot
+    """
+    backend = _get_backend()
+    if snapshot.last_position is None:
+        if snapshot.count != 0:
+            return None
+
+        return list(backend.iter_index_positions())
+
+    try:
+        entries = backend.iter_index_positions(snapshot.last_position)
+        first_entry = next(entries, None)
+        if first_entry is None:
+            return None
+
+        position, (_, digest, _) = first_entry
+        if position != snapshot.last_position or digest != snapshot.last_digest:
+            return None
+
+        return list(entries)
+
+    except ValueError:
+        return None
+
+
+def _load_index_state() -> None:
+    """
+    Loads the index snapshot and the filter of stored digests persisted alongside the index, reading only entries added
+    since they were saved. Both are rebuilt from the whole index when they do not match its content. Access statistics
+    are loaded along with their journals when tracked.
+
+    :return:
+    """
+    global __INDEX_SNAPSHOT
+    global __KEY_FILTER
+    global __ACCESS_STATS
+    global __UNSAVED_ACCESSES
+    global __JOURNALED_ACCESSES
+    global __UNSAVED_REFRESHES
+    backend = _get_backend()
+    snapshot = _IndexSnapshot.from_bytes(backend.load_meta(__INDEX_SNAPSHOT_META))
+    key_filter = BloomFilter.from_bytes(backend.load_meta(__KEY_FILTER_META))
+    is_access_tracked = _is_access_tracked()
+    access_stats = None
+    count_journaled = 0
+    if is_access_tracked:
+        access_stats = _AccessStats.from_bytes(backend.load_meta(__ACCESS_STATS_META))
+        if access_stats is not None:
+            count_journaled = access_stats.load_records(backend.load_meta(__ACCESS_JOURNAL_META) or b'')
+
+    tail_entries = None
+    if snapshot is not None and key_filter is not None and key_filter.count == snapshot.count:
+        tail_entries = _read_index_tail(snapshot)
+
+    if tail_entries is None:
+        logging.info('rebuilding index snapshot and key filter from index')
+        snapshot = _IndexSnapshot()
+        tail_entries = list(backend.iter_index_positions())
+        key_filter = _build_key_filter((digest for _, (_, digest, _) in tail_entries), len(tail_entries))
+        for position, entry in tail_entries:
+            snapshot.add(position, entry)
+
+        is_stats_outdated = is_access_tracked
+        access_stats = access_stats or _AccessStats()
+        if is_access_tracked:
+            access_stats.reconcile(entry for _, entry in tail_entries)
+
+    else:
+        for position, entry in tail_entries:
+            snapshot.add(position, entry)
+            key_filter.add(entry[1])
+
+        if key_filter.is_full():
+            key_filter = _build_key_filter((digest for _, digest, _ in backend.iter_index()), snapshot.count)
+
+        is_stats_outdated = False
+        if is_access_tracked:
+            # tail entries possibly journaled already
+            count_untracked = sum(1 for _, (_, digest, _) in tail_entries
+                                  if access_stats is None or digest not in access_stats.entries)
+            is_stats_outdated = access_stats is None or access_stats.count + count_untracked != snapshot.count
+            if is_stats_outdated:
+                access_stats = access_stats or _AccessStats()
+                access_stats.reconcile(backend.iter_index())
+
+            # entries added after the snapshot was saved, accessed at that time at the earliest
+            for _, (date_str, digest, _) in tail_entries:
+                tail_timestamp = max(_key_date_parse(date_str).timestamp(), snapshot.saved_at or 0.)
+                if digest in access_stats.entries:
+                    access_stats.advance(digest, tail_timestamp)
+
+                else:
+                    access_stats.record(digest, None, tail_timestamp)
+
+        access_stats = access_stats or _AccessStats()
+
+    __INDEX_SNAPSHOT = snapshot
+    __KEY_FILTER = key_filter
+    __ACCESS_STATS = access_stats
+    __UNSAVED_ACCESSES = 0
+    __JOURNALED_ACCESSES = count_journaled
+    __UNSAVED_REFRESHES = 0
+    if is_access_tracked:
+        __UNSAVED_REFRESHES = _load_refreshes(access_stats)
+
+    if tail_entries or is_stats_outdated or access_stats.changed:
+        _save_index_state(compact=is_stats_outdated)
+
+
+def _reset_index_state(entries: List[Tuple[str, str, str]], last_position: Optional[int], save: bool=True) -> None:
+    """
+    Recomputes the snapshot and the filter after the whole index was saved.
+
+    :param entries: new index content
+    :param last_position: position of the last entry as returned by the backend
+    :param save: persisting the new snapshot and filter
+    :return:
+    """
+    global __INDEX_SNAPSHOT
+    global __KEY_FILTER
+    global __ACCESS_STATS
+    global __UNSAVED_ACCESSES
+    global __JOURNALED_ACCESSES
+    global __UNSAVED_REFRESHES
+    snapshot = _IndexSnapshot()
+    for entry in entries[:-1]:
+        snapshot.add(None, entry)
+
+    if entries:
+        snapshot.add(last_position, entries[-1])
+
+    __INDEX_SNAPSHOT = snapshot
+    __KEY_FILTER = _build_key_filter((digest for _, digest, _ in entries), len(entries))
+    is_access_tracked = _is_access_tracked()
+    if __ACCESS_STATS is None or not entries or not is_access_tracked:
+        __ACCESS_STATS = _AccessStats()
+
+    if is_access_tracked:
+        __ACCESS_STATS.reconcile(entries)
+
+    if save:
+        _save_index_state(compact=is_access_tracked)
+
+    else:
+        __ACCESS_STATS.changed.clear()
+        __UNSAVED_ACCESSES = 0
+        __JOURNALED_ACCESSES = 0
+        __UNSAVED_REFRESHES = 0
+
+
+def _get_expiry_dates(as_of_date: datetime=None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    :param as_of_date: fake current date (for dev only)
+    :return: dates before which entries are expired and before which they are removed from the store, both None when
+    entries never expire
+    """
+    expiry_periods, expiry_unit = _get_expiry()
+    if not expiry_periods:
+        return None, None
+
     if as_of_date is None:
         as_of_date = datetime.today()
 
     if expiry_unit == 'day':
-        expiry_date = as_of_date - timedelta(days=expiry_periods)
+        period = timedelta(days=1)
 
     elif expiry_unit == 'second':
-        expiry_date = as_of_date - timedelta(seconds=expiry_periods)
+        period = timedelta(seconds=1)
 
     else:
         raise RuntimeError('expiry unit undefined: {}'.format(expiry_unit))
 
-    expired_keys = list()
+    expiry_date = as_of_date - expiry_periods * period
+    return expiry_date, expiry_date - (_get_stale_periods() or 0) * period
+
+
+def invalidate_expired_entries(as_of_date: datetime=None) -> None:
+    """
+    Removes expired entries, except the ones within the stale period set with set_store_path().
+
+    :param as_of_date: fake current date (for dev only)
+    :return:
+    """
+    _, removal_date = _get_expiry_dates(as_of_date)
+    if removal_date is None:
+        return
+
+    expired_dates = {date_str for date_str in _get_index_snapshot().dates
+                     if removal_date > _key_date_parse(date_str)}
+    if not expired_dates:
+        return
 
-    def gather_expired_keys(line):
-        date_str, key_md5, key_commas = line.strip().split(' ')
-        key = key_commas[1:-1]
-        key_date = _key_date_parse(date_str)
-        if expiry_date > key_date:
-            logging.debug('expired entry for key "%s" (%s)', key_md5[:-1], key)
-            expired_keys.append(key)
+    removal_timestamp = removal_date.timestamp()
+    access_stats = _get_access_stats()
+    expired_digests = list()
+    refreshed_dates = dict()
 
-    osaccess.process_file_by_line(index_name, line_processor=gather_expired_keys)
-    remove_from_store_multiple(expired_keys)
+    def gather_expired_digests(entry):
+        date_str, digest, key = entry
+        if date_str in expired_dates:
+            # index dates are those of the first addition, values may have been refreshed since
+            stored_timestamp = access_stats.stored_at(digest)
+            if stored_timestamp is not None and stored_timestamp >= removal_timestamp:
+                refreshed_date_str = _key_date_format(datetime.fromtimestamp(stored_timestamp))
+                if refreshed_date_str != date_str:
+                    refreshed_dates[digest] = refreshed_date_str
+
+                return
+
+            logging.debug('expired entry for key "%s" (%s)', digest, key)
+            expired_digests.append(digest)
+
+    scan_entries(gather_expired_digests)
+    _remove_digests(expired_digests, refreshed_dates)
 
 
 def _key_date_parse(date_str: str):
@@ -123,105 +881,141 @@ def _key_date_format(a_date: datetime):
 
 
 def list_keys():
-    index_name = _fileindex_name()
-
-    if not osaccess.exists_path(index_name):
+    if not _get_backend().has_index():
         return list()
 
     keys = list()
 
-    def gather_keys(line):
-        fields = line.strip().split(' ')
-        parts = ' '.join(fields[2:])
-        key = parts[1:-1]
+    def gather_keys(entry):
+        date_str, digest, key = entry
         keys.append(key)
 
     scan_entries(gather_keys)
     return sorted(keys)
 
 
-def scan_entries(entry_processor: Callable[[str], None]):
-    index_name = _fileindex_name()
-    return osaccess.process_file_by_line(index_name, line_processor=entry_processor)
+def scan_entries(entry_processor: Callable[[Tuple[str, str, str]], None]):
+    """
+    Applies the processor to every (date, digest, key) entry of the index.
+
+    :param entry_processor:
+    :return:
+    """
+    for entry in _get_backend().iter_index():
+        entry_processor(entry)
 
 
 def is_store_enabled() -> bool:
-    return _get_store_path() is not None
+    return _get_backend() is not None
 
 
-def _generator_count(a_generator: Iterable) -> int:
-    return sum(1 for _ in a_generator)
+def _acquire_store_lock() -> None:
+    start = time.perf_counter()
+    __rebalancing.acquire()
+    _METRIC_LOCK_WAIT.observe(time.perf_counter() - start)
 
 
-def _divide_node(path: str, nodes_path: MutableSequence[str]) -> Tuple[str, str]:
-    level = len(nodes_path)
-    new_node_sup_init = 'FF' * 20
-    new_node_inf_init = '7F' + 'FF' * 19
-    if level > 0:
-        new_node_sup = nodes_path[-1]
-        new_node_diff = (int(new_node_sup_init, 16) - int(new_node_inf_init, 16)) >> level
-        new_node_inf = '%0.40X' % (int(new_node_sup, 16) - new_node_diff)
+@contextmanager
+def _store_lock():
+    _acquire_store_lock()
+    try:
+        yield
 
-    else:
-        new_node_sup = new_node_sup_init
-        new_node_inf = new_node_inf_init
-
-    new_path_1 = osaccess.create_new_filepath(path, nodes_path, new_node_inf.lower())
-    new_path_2 = osaccess.create_new_filepath(path, nodes_path, new_node_sup.lower())
-    return new_path_1, new_path_2
-
-
-def _rebalance_store_tree(path: str, nodes_path: List[str]=None):
-    if not nodes_path:
-        nodes_path = list()
-
-    current_path = osaccess.merge_directory_paths([path], nodes_path)
-    files_node = (node for node in osaccess.gen_files_under(current_path) if node != __STORE_INDEX_NAME)
-    rebalancing_required = _generator_count(itertools.islice(files_node, _get_max_node_files() + 1)) > _get_max_node_files()
-    if rebalancing_required:
-        new_path_1, new_path_2 = _divide_node(path, nodes_path)
-        logging.info('rebalancing required, creating nodes: %s and %s', new_path_1, new_path_2)
-        with __rebalancing:
-            logging.info('lock acquired: rebalancing started')
-            osaccess.create_path_if_not_exists(new_path_1)
-            osaccess.create_path_if_not_exists(new_path_2)
-
-            for filename in (node for node in osaccess.gen_files_under(current_path) if node != __STORE_INDEX_NAME):
-                file_path = osaccess.build_file_path(current_path, filename)
-                if file_path <= new_path_1:
-                    logging.debug('moving %s to %s', filename, new_path_1)
-                    osaccess.rename_path(file_path, osaccess.build_file_path(new_path_1, filename))
+    finally:
+        __rebalancing.notify_all()
+        __rebalancing.release()
 
-                else:
-                    logging.debug('moving %s to %s', filename, new_path_2)
-                    osaccess.rename_path(file_path, osaccess.build_file_path(new_path_2, filename))
 
-        logging.info('lock released: rebalancing completed')
+def _hash_md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
 
-    for directory in osaccess.gen_directories_under(current_path):
-        _rebalance_store_tree(path, nodes_path + [directory])
 
+def _hash_blake2b(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
-def _find_node(digest: str, path=None):
-    if not path:
-        path = _get_store_path()
 
-    directories = osaccess.gen_directories_under(path)
+def _hash_xxh128(data: bytes) -> str:
+    return xxhash.xxh3_128_hexdigest(data)
 
-    if not directories:
-        return path
 
-    else:
-        target_directory = None
-        for directory_name in directories:
-            if digest <= directory_name:
-                target_directory = directory_name
-                break
+_KEY_HASHES = {'md5': _hash_md5, 'blake2b': _hash_blake2b, 'xxh128': _hash_xxh128}
+
+
+def _get_hash_function(key_hash: str) -> Callable[[bytes], str]:
+    """
+    :param key_hash: one of ('md5', 'blake2b', 'xxh128'), all producing 32 hexadecimal characters digests
+    :return:
+    """
+    if key_hash not in _KEY_HASHES:
+        raise ValueError('unknown key hash "{}", expected one of {}'.format(key_hash, sorted(_KEY_HASHES)))
+
+    if key_hash == 'xxh128' and xxhash is None:
+        raise RuntimeError('key hash "xxh128" requires the xxhash package')
+
+    return _KEY_HASHES[key_hash]
+
+
+@functools.lru_cache(maxsize=__DIGEST_MEMO_SIZE)
+def _get_text_digest(key: str, key_hash: str) -> str:
+    return _KEY_HASHES[key_hash](repr(key).encode('utf-8'))
+
+
+def _get_digest(key: str) -> str:
+    # digests of recent text keys are memoized, a single access typically hashing its key several times
+    if type(key) is str:
+        return _get_text_digest(key, _get_key_hash())
+
+    return _KEY_HASHES[_get_key_hash()](repr(key).encode('utf-8'))
+
+
+def _get_content_digest(value: bytes) -> str:
+    # prefixed so that values never collide with key digests
+    return _KEY_HASHES[_get_key_hash()](b'\x00' + value)
+
+
+def _save_content(digest: str, value: bytes, is_existing_key: bool) -> None:
+    """
+    Content-addressed mode: the value is saved once under the digest of its content, the key entry holding that
+    content digest.
+
+    :param digest: key digest
+    :param value:
+    :param is_existing_key:
+    :return:
+    """
+    backend = _get_backend()
+    content_digest = _get_content_digest(value)
+    previous_content_digest = None
+    if is_existing_key:
+        previous_content = backend.load_value(digest)
+        if previous_content is not None:
+            previous_content_digest = previous_content.decode('ascii')
+
+    if previous_content_digest == content_digest:
+        return
+
+    if content_digest not in __CONTENT_REFCOUNTS or not backend.has_value(content_digest):
+        backend.save_value(content_digest, value)
+
+    backend.save_value(digest, content_digest.encode('ascii'))
+    _update_content_refcount(content_digest, 1)
+    if previous_content_digest is not None:
+        _release_content(previous_content_digest)
+
+
+def _release_content(content_digest: str) -> None:
+    if _update_content_refcount(content_digest, -1) == 0:
+        logging.debug('removing unreferenced content %s', content_digest)
+        _get_backend().remove_value(content_digest)
+
 
-        if not target_directory:
-            raise Exception('Inconsistent store tree: expected directory "%s" not found', target_directory)
+def _load_content(digest: str) -> Optional[bytes]:
+    backend = _get_backend()
+    content_digest = backend.load_value(digest)
+    if content_digest is None:
+        return None
 
-        return _find_node(digest, path=osaccess.build_directory_path(path, target_directory))
+    return backend.load_value(content_digest.decode('ascii'))
 
 
 def get_store_id(key: str) -> str:
@@ -230,12 +1024,7 @@ def get_store_id(key: str) -> str:
     :param key: text uniquely identifying the associated content (typically a full url)
     :return: unique path based on hashed version of the input key
     """
-    key = repr(key)
-    hash_md5 = hashlib.md5()
-    hash_md5.update(key.encode('utf-8'))
-    digest = hash_md5.hexdigest()
-    target_node = _find_node(digest)
-    return osaccess.build_file_path(target_node, digest)
+    return _get_backend().value_location(_get_digest(key))
 
 
 def has_store_key(key):
@@ -245,96 +1034,512 @@ def has_store_key(key):
     :param key:
     :return:
     """
-    return osaccess.exists_path(get_store_id(key))
+    return _has_digest(_get_digest(key))
 
 
-def _fileindex_name():
-    return osaccess.build_file_path(_get_store_path(), __STORE_INDEX_NAME)
+def _has_digest(digest: str) -> bool:
+    if digest not in _get_key_filter():
+        _METRIC_FILTER_NEGATIVES.inc()
+        return False
 
+    return _get_backend().has_value(digest)
 
-def add_to_store(key: str, value: bytes) -> None:
 
-    is_existing_key = has_store_key(key)
+def has_store_keys(keys: Iterable[str]) -> List[bool]:
+    """
+    Batched version of has_store_key(), cheaper than checking keys one by one.
 
-    __rebalancing.acquire()
+    :param keys:
+    :return: for each key, whether it corresponds to an entry in the store
+    """
+    digests = [_get_digest(key) for key in keys]
+    key_filter = _get_key_filter()
+    candidates = [digest for digest in digests if digest in key_filter]
+    _METRIC_FILTER_NEGATIVES.inc(len(digests) - len(candidates))
+    stored_digests = _get_backend().has_values(candidates)
+    return [digest in stored_digests for digest in digests]
 
-    try:
+
+def add_to_store(key: str, value: bytes) -> None:
+    with _METRIC_ADD.time():
+        _add_to_store(key, _get_digest(key), value)
+
+
+def _add_to_store(key: str, digest: str, value: bytes) -> None:
+    global __KEY_FILTER
+    backend = _get_backend()
+    with _store_lock():
         logging.debug('adding to store: %s', key)
-        filename = get_store_id(key)
-        filename_digest = osaccess.get_file_from_filepath(filename)
-        index_name = _fileindex_name()
-        today = datetime.today().strftime('%Y%m%d')
+        key_filter = _get_key_filter()
+        is_existing_key = digest in key_filter and backend.has_value(digest)
+        if not is_existing_key:
+            key_filter.add(digest)
+
         today = _key_date_format(datetime.today())
-        osaccess.save_content(filename, value)
+        if _is_content_addressed():
+            _save_content(digest, value, is_existing_key)
+
+        else:
+            backend.save_value(digest, value)
+
+        is_access_tracked = _is_access_tracked()
+        if is_access_tracked:
+            timestamp = time.time()
+            _get_access_stats().record(digest, len(value), timestamp)
+            if is_existing_key:
+                _journal_refresh(digest, timestamp)
+
+        snapshot = _get_index_snapshot()
+        is_rebalancing_due = False
         if not is_existing_key:
-            index_entry = '%s %s: "%s"\n' % (today, filename_digest, key)
-            osaccess.append_content(index_name, bytes(index_entry, 'utf-8'))
+            position = backend.append_index(today, digest, key)
+            snapshot.add(position, (today, digest, key))
+            if key_filter.is_full():
+                __KEY_FILTER = _build_key_filter((digest for _, digest, _ in backend.iter_index()), snapshot.count)
 
-    finally:
-        __rebalancing.notify_all()
-        __rebalancing.release()
+            is_rebalancing_due = snapshot.count % __REBALANCING_LIMIT == 0
+
+        if is_rebalancing_due:
+            _save_index_state()
+
+        elif is_access_tracked and _track_access():
+            _save_access_stats()
 
-    if osaccess.file_size(index_name) % __REBALANCING_LIMIT == 0:
+    if is_rebalancing_due:
         logging.debug('rebalancing store')
-        _rebalance_store_tree(_get_store_path())
+        with _METRIC_REBALANCE.time():
+            _METRIC_NODE_SPLITS.inc(backend.rebalance(_get_max_node_files(), _store_lock))
+
+    if _is_over_quota():
+        evict_entries()
 
 
 def retrieve_from_store(key: str, fail_on_missing: bool=False) -> bytes:
-    __rebalancing.acquire()
-    try:
-        logging.debug('reading from store: %s', key)
-        if osaccess.exists_path(get_store_id(key)):
-            content = osaccess.load_file_content(get_store_id(key))
+    with _METRIC_RETRIEVE.time():
+        return _retrieve_from_store(key, _get_digest(key), fail_on_missing)
 
-        else:
-            if fail_on_missing:
-                raise KeyError('store has no such key: "{}"'.format(key))
+
+def retrieve_fresh_from_store(key: str) -> Tuple[Optional[bytes], bool]:
+    """
+    Retrieves an entry along with its expiry state, entries expired beyond the stale period being considered missing.
+
+    :param key:
+    :return: stored value or None when missing, and whether the entry is stale
+    """
+    digest = _get_digest(key)
+    with _METRIC_RETRIEVE.time():
+        content = _retrieve_from_store(key, digest)
+
+    if content is None:
+        return None, False
+
+    expiry_date, removal_date = _get_expiry_dates()
+    if expiry_date is None:
+        return content, False
+
+    stored_timestamp = _get_access_stats().stored_at(digest)
+    if stored_timestamp is None or stored_timestamp >= expiry_date.timestamp():
+        return content, False
+
+    if stored_timestamp < removal_date.timestamp():
+        return None, False
+
+    return content, True
+
+
+def _retrieve_from_store(key: str, digest: str, fail_on_missing: bool=False) -> Optional[bytes]:
+    with _store_lock():
+        logging.debug('reading from store: %s', key)
+        if digest in _get_key_filter():
+            if _is_content_addressed():
+                content = _load_content(digest)
 
             else:
-                content = None
+                content = _get_backend().load_value(digest)
 
-    except FileNotFoundError:
-        content = None
+            if content is not None and _is_access_tracked():
+                _get_access_stats().touch(digest, time.time())
+                if _track_access():
+                    _save_access_stats()
 
-    finally:
-        __rebalancing.notify_all()
-        __rebalancing.release()
+        else:
+            _METRIC_FILTER_NEGATIVES.inc()
+            content = None
+
+    if content is None and fail_on_missing:
+        raise KeyError('store has no such key: "{}"'.format(key))
 
     return content
 
 
-def remove_from_store_multiple(keys):
-    __rebalancing.acquire()
-    try:
-        index_name = _fileindex_name()
-        lines = osaccess.load_file_lines(index_name)
+def _remove_digests(digests: Iterable[str], refreshed_dates: Dict[str, str]=None) -> None:
+    """
+    :param digests: digests to be removed from the store
+    :param refreshed_dates: new index dates by digest, for entries being kept
+    :return:
+    """
+    backend = _get_backend()
+    refreshed_dates = refreshed_dates or dict()
+    with _store_lock():
+        removed_digests = set()
+        for digest in digests:
+            logging.info('removing digest %s from store', digest)
+            if _is_content_addressed():
+                content_digest = backend.load_value(digest)
+                if content_digest is not None:
+                    _release_content(content_digest.decode('ascii'))
+
+            backend.remove_value(digest)
+            removed_digests.add(digest)
+
+        if removed_digests or refreshed_dates:
+            entries = [(refreshed_dates.get(digest, date_str), digest, key)
+                       for date_str, digest, key in backend.iter_index() if digest not in removed_digests]
+            _reset_index_state(entries, backend.save_index(entries))
+            if _is_content_addressed():
+                _save_content_refcounts()
 
-        for key in keys:
-            filename = get_store_id(key)
-            filename_digest = osaccess.get_file_from_filepath(filename)
-            logging.info('removing key %s from store' % key)
-            osaccess.remove_file(filename)
-            lines = [line for line in lines if line.split(' ')[1] != filename_digest + ':']
 
-        osaccess.save_lines(index_name, lines)
+def remove_from_store_multiple(keys):
+    for key in keys:
+        logging.info('removing key %s from store' % key)
 
-    finally:
-        __rebalancing.notify_all()
-        __rebalancing.release()
+    _remove_digests(_get_digest(key) for key in keys)
 
 
 def remove_from_store(key):
     remove_from_store_multiple([key])
 
 
+def verify_store(fix: bool=False, pool_size: int=8) -> Dict[str, List[str]]:
+    """
+    Reconciles stored values with the index, typically after a crash or files removed manually.
+
+    :param fix: removes orphan values, drops index entries without a value and moves misplaced values
+    :param pool_size: number of threads scanning the storage
+    :return: digests of orphan values (stored but not indexed), missing values (indexed but not stored), duplicate
+    index entries and misplaced values
+    """
+    global __CONTENT_REFCOUNTS
+    backend = _get_backend()
+    with _store_lock():
+        stored_digests, misplaced_digests = backend.scan_values(pool_size)
+        entries = list()
+        indexed_digests = set()
+        duplicate_digests = set()
+        for entry in backend.iter_index():
+            digest = entry[1]
+            if digest in indexed_digests:
+                duplicate_digests.add(digest)
+                continue
+
+            indexed_digests.add(digest)
+            entries.append(entry)
+
+        valid_digests = stored_digests & indexed_digests
+        referenced_digests = set()
+        refcounts = dict()
+        if _is_content_addressed():
+            # keys referring to missing contents are reported as missing values
+            for digest in sorted(valid_digests):
+                content_digest = backend.load_value(digest)
+                content_digest = content_digest.decode('ascii') if content_digest is not None else None
+                if content_digest not in stored_digests:
+                    valid_digests.discard(digest)
+                    continue
+
+                referenced_digests.add(content_digest)
+                refcounts[content_digest] = refcounts.get(content_digest, 0) + 1
+
+        report = {
+            'orphan_values': sorted(stored_digests - indexed_digests - referenced_digests),
+            'missing_values': sorted(indexed_digests - valid_digests),
+            'duplicate_entries': sorted(duplicate_digests),
+            'misplaced_values': sorted(misplaced_digests),
+        }
+        logging.info('store verification: %s', ', '.join('{} {}'.format(len(digests), name.replace('_', ' '))
+                                                          for name, digests in report.items()))
+        if fix:
+            for digest in report['misplaced_values']:
+                backend.repair_value(digest)
+
+            for digest in report['orphan_values'] + report['missing_values']:
+                logging.info('removing orphan or incomplete value %s', digest)
+                backend.remove_value(digest)
+
+            entries = [entry for entry in entries if entry[1] in valid_digests]
+            _reset_index_state(entries, backend.save_index(entries))
+            if _is_content_addressed():
+                __CONTENT_REFCOUNTS = refcounts
+                _save_content_refcounts()
+
+    return report
+
+
+def rebuild_store(pool_size: int=8) -> Dict[str, List[str]]:
+    """
+    Fixes any inconsistency between stored values and the index.
+
+    :param pool_size: number of threads scanning the storage
+    :return: inconsistencies found, as reported by verify_store()
+    """
+    return verify_store(fix=True, pool_size=pool_size)
+
+
+def _get_quota() -> Tuple[Optional[int], Optional[int], str]:
+    global __MAX_BYTES
+    global __MAX_ENTRIES
+    global __EVICTION_POLICY
+    return __MAX_BYTES, __MAX_ENTRIES, __EVICTION_POLICY
+
+
+def _is_over_quota() -> bool:
+    max_bytes, max_entries, _ = _get_quota()
+    access_stats = _get_access_stats()
+    if max_entries is not None and access_stats.count > max_entries:
+        return True
+
+    return max_bytes is not None and (len(access_stats.unsized) > 0 or access_stats.total_bytes > max_bytes)
+
+
+def _get_value_size(digest: str) -> Optional[int]:
+    backend = _get_backend()
+    if not _is_content_addressed():
+        return backend.value_size(digest)
+
+    content_digest = backend.load_value(digest)
+    if content_digest is None:
+        return None
+
+    return backend.value_size(content_digest.decode('ascii'))
+
+
+def evict_entries() -> int:
+    """
+    Removes the coldest entries, according to the eviction policy, when the store exceeds the max_bytes or
+    max_entries quota set with set_store_path(). Entries are evicted in one batch bringing the store a fraction
+    below its quota, so that evictions do not happen on every addition. Entries are selected from the access
+    statistics kept in memory, without scanning the storage.
+
+    :return: number of entries evicted
+    """
+    max_bytes, max_entries, eviction_policy = _get_quota()
+    if max_bytes is None and max_entries is None:
+        return 0
+
+    with _store_lock():
+        access_stats = _get_access_stats()
+        if max_bytes is not None:
+            # values stored before their size was tracked
+            for digest in list(access_stats.unsized):
+                access_stats.set_size(digest, _get_value_size(digest) or 0)
+
+        count_entries = 0
+        if max_entries is not None and access_stats.count > max_entries:
+            count_entries = access_stats.count - int(max_entries * __EVICTION_TARGET_RATIO)
+
+        count_bytes = 0
+        if max_bytes is not None and access_stats.total_bytes > max_bytes:
+            count_bytes = access_stats.total_bytes - int(max_bytes * __EVICTION_TARGET_RATIO)
+
+        if count_entries == 0 and count_bytes == 0:
+            return 0
+
+        evicted_digests = access_stats.coldest(eviction_policy, count_entries, count_bytes)
+        logging.info('evicting %d entries from store (%s)', len(evicted_digests), eviction_policy)
+        _remove_digests(evicted_digests)
+
+    _METRIC_EVICTIONS.inc(len(evicted_digests))
+    return len(evicted_digests)
+
+
+def _open_archive(archive_path: str, mode: str, compression: Optional[str]=None) -> BinaryIO:
+    if compression is None:
+        return open(archive_path, mode)
+
+    if compression not in _ARCHIVE_COMPRESSIONS:
+        raise ValueError('unknown compression "{}", expected one of {}'.format(compression,
+                                                                              sorted(_ARCHIVE_COMPRESSIONS)))
+
+    return _ARCHIVE_COMPRESSIONS[compression](archive_path, mode)
+
+
+def _detect_archive_compression(archive_path: str) -> Optional[str]:
+    with open(archive_path, 'rb') as archive:
+        leading_bytes = archive.read(len(_ARCHIVE_MAGIC))
+
+    return next((compression for magic, compression in _ARCHIVE_COMPRESSION_MAGICS
+                 if leading_bytes.startswith(magic)), None)
+
+
+def _read_archive_bytes(archive: BinaryIO, size: int) -> bytes:
+    data = archive.read(size)
+    if len(data) != size:
+        raise ValueError('truncated store archive')
+
+    return data
+
+
+def _gen_archive_records(archive: BinaryIO) -> Iterator[Tuple[Tuple[str, str, str], bytes]]:
+    """
+    :param archive: stream positioned after the header
+    :return: ((date, digest, key), value) records
+    """
+    while True:
+        marker = _read_archive_bytes(archive, 1)
+        if marker == _ARCHIVE_END_MARKER:
+            return
+
+        if marker != _ARCHIVE_RECORD_MARKER:
+            raise ValueError('corrupted store archive: unexpected record marker {!r}'.format(marker))
+
+        date_bytes, digest_bytes, key_size, value_size = _ARCHIVE_RECORD.unpack(
+            _read_archive_bytes(archive, _ARCHIVE_RECORD.size))
+        key = _read_archive_bytes(archive, key_size).decode('utf-8')
+        value = _read_archive_bytes(archive, value_size)
+        yield (date_bytes.decode('ascii'), digest_bytes.decode('ascii'), key), value
+
+
+def export_store(archive_path: str, compression: Optional[str]=None) -> int:
+    """
+    Streams the index and the values of the store into a single archive file, readable by import_store().
+
+    :param archive_path: target file
+    :param compression: one of (None, 'gzip', 'bz2', 'lzma')
+    :return: number of entries exported
+    """
+    backend = _get_backend()
+    with _store_lock():
+        entries = list(backend.iter_index())
+
+    header = json.dumps({'content_addressed': _is_content_addressed(), 'key_hash': _get_key_hash()}).encode('utf-8')
+    count_exported = 0
+    with _open_archive(archive_path, 'wb', compression) as archive:
+        archive.write(_ARCHIVE_HEADER.pack(_ARCHIVE_MAGIC, _ARCHIVE_VERSION, len(header)))
+        archive.write(header)
+        entries = iter(entries)
+        while True:
+            chunk = list(itertools.islice(entries, _ARCHIVE_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            with _store_lock():
+                if _is_content_addressed():
+                    values = [_load_content(digest) for _, digest, _ in chunk]
+
+                else:
+                    values = [backend.load_value(digest) for _, digest, _ in chunk]
+
+            for (date_str, digest, key), value in zip(chunk, values):
+                if value is None:
+                    logging.warning('skipping export of entry without value: %s (%s)', digest, key)
+                    continue
+
+                key_bytes = str(key).encode('utf-8')
+                archive.write(_ARCHIVE_RECORD_MARKER)
+                archive.write(_ARCHIVE_RECORD.pack(date_str.encode('ascii'), digest.encode('ascii'), len(key_bytes),
+                                                   len(value)))
+                archive.write(key_bytes)
+                archive.write(value)
+                count_exported += 1
+
+        archive.write(_ARCHIVE_END_MARKER)
+
+    logging.info('exported %d entries to %s', count_exported, archive_path)
+    return count_exported
+
+
+def import_store(archive_path: str) -> int:
+    """
+    Loads an archive created by export_store() into the current store, the entry dates being kept. Values are written
+    in batches and the store tree is rebalanced once all entries are imported.
+
+    :param archive_path: file created by export_store(), compression being detected automatically
+    :return: number of entries imported
+    """
+    global __KEY_FILTER
+    backend = _get_backend()
+    count_imported = 0
+    with _open_archive(archive_path, 'rb', _detect_archive_compression(archive_path)) as archive:
+        magic, version, header_size = _ARCHIVE_HEADER.unpack(_read_archive_bytes(archive, _ARCHIVE_HEADER.size))
+        if magic != _ARCHIVE_MAGIC or version != _ARCHIVE_VERSION:
+            raise ValueError('not a store archive (version {}): {}'.format(_ARCHIVE_VERSION, archive_path))
+
+        header = json.loads(_read_archive_bytes(archive, header_size).decode('utf-8'))
+        archive_key_hash = header.get('key_hash', __DEFAULT_KEY_HASH)
+        if archive_key_hash != _get_key_hash():
+            raise ValueError('archive digests use key_hash={}, store expecting key_hash={}'.format(archive_key_hash,
+                                                                                                 _get_key_hash()))
+
+        logging.info('importing %s (content_addressed=%s)', archive_path, header.get('content_addressed'))
+        records = _gen_archive_records(archive)
+        while True:
+            chunk = list(itertools.islice(records, _ARCHIVE_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            with _store_lock():
+                key_filter = _get_key_filter()
+                existing_digests = backend.has_values(digest for (_, digest, _), _ in chunk if digest in key_filter)
+                new_entries = list()
+                values = list()
+                access_stats = _get_access_stats()
+                is_access_tracked = _is_access_tracked()
+                for entry, value in chunk:
+                    digest = entry[1]
+                    is_existing_key = digest in existing_digests
+                    if is_access_tracked:
+                        timestamp = _key_date_parse(entry[0]).timestamp()
+                        if is_existing_key and access_stats.stored_at(digest) is not None:
+                            # archived entry possibly older than the one in store
+                            access_stats.set_size(digest, len(value))
+                            access_stats.advance(digest, timestamp)
+
+                        else:
+                            access_stats.record(digest, len(value), timestamp)
+
+                    if _is_content_addressed():
+                        _save_content(digest, value, is_existing_key)
+
+                    else:
+                        values.append((digest, value))
+
+                    if not is_existing_key:
+                        new_entries.append(entry)
+                        existing_digests.add(digest)
+
+                backend.save_values(values)
+                last_position = backend.extend_index(new_entries)
+                snapshot = _get_index_snapshot()
+                for position, entry in enumerate(new_entries, start=1):
+                    snapshot.add(last_position if position == len(new_entries) else None, entry)
+                    key_filter.add(entry[1])
+
+                if key_filter.is_full():
+                    __KEY_FILTER = _build_key_filter((digest for _, digest, _ in backend.iter_index()), snapshot.count)
+
+                count_imported += len(chunk)
+
+    with _store_lock():
+        _save_index_state()
+
+    logging.debug('rebalancing store after import')
+    with _METRIC_REBALANCE.time():
+        _METRIC_NODE_SPLITS.inc(backend.rebalance(_get_max_node_files(), _store_lock))
+
+    evict_entries()
+    logging.info('imported %d entries from %s', count_imported, archive_path)
+    return count_imported
+
+
 def empty_store():
     """
     Removing cache content.
     :return:
     """
     if is_store_enabled():
-        for node in osaccess.get_files_under_path(_get_store_path()):
-            node_path = osaccess.build_file_path(_get_store_path(), node)
-            osaccess.remove_all_under_path(node_path)
-
-    osaccess.remove_file_if_exists(_fileindex_name())
+        with _store_lock():
+            _get_backend().clear()
+            _reset_index_state(list(), None, save=False)
+            __CONTENT_REFCOUNTS.clear()
+            _save_store_format()
@@ -0,0 +1,269 @@
+"""
+Lightweight in-process metrics.
+Counters, gauges and latency histograms are registered by name in a global registry, updating them only costs a lock
+and a few additions so they can be left enabled in production.
+Collected values are exported either as a plain dict or in Prometheus text format:
+    >>> from webscrapetools import metrics
+    >>> pages = metrics.counter('pages_total', 'Pages downloaded')
+    >>> pages.inc()
+    >>> metrics.snapshot()['pages_total']
+    1
+    >>> print(metrics.to_prometheus().splitlines()[-1])
+    pages_total 1
+
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'MetricsRegistry', 'get_registry', 'counter', 'gauge', 'histogram',
+           'snapshot', 'to_prometheus', 'reset_metrics']
+
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.,
+                           2.5, 5., 10., 30.)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+
+        return repr(value)
+
+    return str(value)
+
+
+class Counter(object):
+    """
+    Monotonically increasing value.
+    """
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, description: str=''):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount=1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = 0
+
+    def snapshot(self):
+        return self._value
+
+    def prometheus_samples(self) -> List[str]:
+        return ['{} {}'.format(self.name, _format_value(self._value))]
+
+
+class Gauge(Counter):
+    """
+    Value going up and down, such as a queue depth.
+    """
+
+    metric_type = 'gauge'
+
+    def dec(self, amount=1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value) -> None:
+        with self._lock:
+            self._value = value
+
+
+class _HistogramTimer(object):
+
+    def __init__(self, histogram: 'Histogram'):
+        self._histogram = histogram
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Histogram(object):
+    """
+    Distribution of observed values (typically durations in seconds) over fixed buckets.
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, description: str='', buckets: Optional[Sequence[float]]=None):
+        self.name = name
+        self.description = description
+        if buckets is None:
+            buckets = DEFAULT_LATENCY_BUCKETS
+
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._count = 0
+        self._sum = 0.
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def time(self) -> _HistogramTimer:
+        """
+        Context manager observing the duration of the enclosed block.
+
+        :return:
+        """
+        return _HistogramTimer(self)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self._buckets) + 1)
+            self._count = 0
+            self._sum = 0.
+
+    def _cumulative_buckets(self) -> List[tuple]:
+        with self._lock:
+            counts = list(self._counts)
+
+        cumulative = list()
+        total = 0
+        for upper_bound, count in zip(self._buckets + (float('inf'),), counts):
+            total += count
+            cumulative.append((upper_bound, total))
+
+        return cumulative
+
+    def snapshot(self) -> Dict:
+        return {'count': self._count, 'sum': self._sum,
+                'buckets': {_format_value(upper_bound): count
+                            for upper_bound, count in self._cumulative_buckets()}}
+
+    def prometheus_samples(self) -> List[str]:
+        samples = ['{}_bucket{{le="{}"}} {}'.format(self.name, _format_value(upper_bound), count)
+                   for upper_bound, count in self._cumulative_buckets()]
+        samples.append('{}_sum {}'.format(self.name, _format_value(self._sum)))
+        samples.append('{}_count {}'.format(self.name, self._count))
+        return samples
+
+
+class MetricsRegistry(object):
+    """
+    Named collection of metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = dict()
+
+    def _register(self, metric_class, name: str, description: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, description, **kwargs)
+                self._metrics[name] = metric
+
+            elif type(metric) is not metric_class:
+                raise ValueError('metric "{}" already registered as a {}'.format(name, metric.metric_type))
+
+        return metric
+
+    def counter(self, name: str, description: str='') -> Counter:
+        return self._register(Counter, name, description)
+
+    def gauge(self, name: str, description: str='') -> Gauge:
+        return self._register(Gauge, name, description)
+
+    def histogram(self, name: str, description: str='', buckets: Optional[Sequence[float]]=None) -> Histogram:
+        return self._register(Histogram, name, description, buckets=buckets)
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def snapshot(self) -> Dict:
+        """
+        Current values of all metrics, histograms being exported as dicts (count, sum and cumulative buckets).
+
+        :return:
+        """
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+    def to_prometheus(self) -> str:
+        """
+        Current values of all metrics in Prometheus text exposition format.
+
+        :return:
+        """
+        lines = list()
+        for name, metric in sorted(self._metrics.items()):
+            if metric.description:
+                lines.append('# HELP {} {}'.format(name, metric.description))
+
+            lines.append('# TYPE {} {}'.format(name, metric.metric_type))
+            lines.extend(metric.prometheus_samples())
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """
+        Resets all values, metrics remain registered.
+
+        :return:
+        """
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+
+__registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return __registry
+
+
+def counter(name: str, description: str='') -> Counter:
+    return get_registry().counter(name, description)
+
+
+def gauge(name: str, description: str='') -> Gauge:
+    return get_registry().gauge(name, description)
+
+
+def histogram(name: str, description: str='', buckets: Optional[Sequence[float]]=None) -> Histogram:
+    return get_registry().histogram(name, description, buckets)
+
+
+def snapshot() -> Dict:
+    return get_registry().snapshot()
+
+
+def to_prometheus() -> str:
+    return get_registry().to_prometheus()
+
+
+def reset_metrics() -> None:
+    get_registry().reset()
@@ -1,33 +1,7 @@
 import os
 from shutil import rmtree
 import logging
-from typing import Iterable, List, Callable
-
-
-class Path(object):
-    pass
-
-
-class FilePath(Path):
-    pass
-
-
-class DirectoryPath(Path):
-    pass
-
-
-class _OSFilePath(FilePath):
-
-    def __init__(self, path: str):
-        FilePath.__init__(self)
-        self._path = path
-
-
-class _OSDirectoryPath(DirectoryPath):
-
-    def __init__(self, path: str):
-        DirectoryPath.__init__(self)
-        self._path = path
+from typing import Iterable, Iterator, List, Callable, Tuple, Optional
 
 
 def create_path_if_not_exists(path: str) -> str:
@@ -42,6 +16,10 @@ def rename_path(old_path, new_path):
     os.rename(old_path, new_path)
 
 
+def replace_path(old_path, new_path):
+    os.replace(old_path, new_path)
+
+
 def create_new_filepath(path_prefix, path, filename):
     return os.path.abspath(os.path.sep.join([path_prefix] + path + [filename]))
 
@@ -71,6 +49,18 @@ def file_size(filename):
     return count + 1
 
 
+def get_file_bytes(filename: str) -> Optional[int]:
+    """
+    :param filename:
+    :return: size of the file in bytes, None if missing
+    """
+    try:
+        return os.path.getsize(filename)
+
+    except FileNotFoundError:
+        return None
+
+
 def get_file_from_filepath(path):
     return path.split(os.path.sep)[-1]
 
@@ -133,6 +123,24 @@ def process_file_by_line(filename: str, line_processor: Callable[[str], None]) -
             line_processor(line)
 
 
+def gen_file_lines_positions(filename: str, offset: int=0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Non-empty lines of a file read from the specified offset, along with their respective offsets.
+
+    :param filename:
+    :param offset:
+    :return:
+    """
+    with open(filename, 'rb') as lines_file:
+        lines_file.seek(offset)
+        position = offset
+        for line in lines_file:
+            if len(line.strip()) > 0:
+                yield position, line
+
+            position += len(line)
+
+
 def save_lines(filepath: str, lines: Iterable[str]) -> None:
     with open(filepath, 'w') as myfile:
         myfile.writelines(lines)
@@ -143,11 +151,19 @@ def save_content(filename: str, content: bytes) -> None:
         myfile.write(content)
 
 
-def append_content(filepath: str, content: bytes):
+def append_content(filepath: str, content: bytes) -> int:
+    """
+    :return: offset at which the content was written
+    """
     if not exists_path(filepath):
         with open(filepath, 'wb') as myfile:
             myfile.write(content)
 
+        return 0
+
     else:
         with open(filepath, 'ab') as myfile:
+            position = myfile.tell()
             myfile.write(content)
+
+        return position
@@ -0,0 +1,839 @@
+"""
+Storage backends for the keyvalue store.
+Values are addressed by the digest of their key and the index keeps one (date, digest, key) entry per stored key.
+Three implementations are available:
+    - 'filesystem': one file per value, spread over a tree of nodes rebalanced as the store grows (default)
+    - 'memory': plain dicts, for very fast tests and ephemeral runs
+    - 'sqlite': a single SQLite database file
+"""
+import itertools
+import logging
+import os
+import re
+import sqlite3
+import threading
+from multiprocessing.pool import ThreadPool
+from typing import Iterator, Iterable, Tuple, Optional, List, MutableSequence, Callable, ContextManager, Set
+
+from webscrapetools import osaccess
+
+
+__all__ = ['StoreBackend', 'FileSystemBackend', 'MemoryBackend', 'SQLiteBackend', 'create_backend',
+           'register_backend']
+
+IndexEntry = Tuple[str, str, str]
+
+
+class StoreBackend(object):
+    """
+    Interface implemented by storage backends.
+    Thread safety of write operations is handled by the keyvalue module, backends only have to support
+    concurrent reads.
+    """
+
+    def __init__(self, store_path: str):
+        self._store_path = store_path
+
+    @property
+    def store_path(self) -> str:
+        return self._store_path
+
+    def open(self) -> None:
+        """
+        Prepares the underlying storage, creating it if required.
+
+        :return:
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        pass
+
+    def has_value(self, digest: str) -> bool:
+        raise NotImplementedError()
+
+    def has_values(self, digests: Iterable[str]) -> Set[str]:
+        """
+        Batched version of has_value().
+
+        :param digests:
+        :return: digests having a stored value
+        """
+        return {digest for digest in digests if self.has_value(digest)}
+
+    def load_value(self, digest: str) -> Optional[bytes]:
+        """
+        :param digest:
+        :return: stored value or None when missing
+        """
+        raise NotImplementedError()
+
+    def value_size(self, digest: str) -> Optional[int]:
+        """
+        :param digest:
+        :return: size in bytes of the stored value or None when missing
+        """
+        value = self.load_value(digest)
+        if value is None:
+            return None
+
+        return len(value)
+
+    def save_value(self, digest: str, value: bytes) -> None:
+        raise NotImplementedError()
+
+    def save_values(self, values: Iterable[Tuple[str, bytes]]) -> None:
+        """
+        Batched version of save_value().
+
+        :param values: (digest, value) pairs
+        :return:
+        """
+        for digest, value in values:
+            self.save_value(digest, value)
+
+    def remove_value(self, digest: str) -> None:
+        raise NotImplementedError()
+
+    def value_location(self, digest: str) -> str:
+        """
+        :param digest:
+        :return: text uniquely locating the value within the backend (a file path for the filesystem backend)
+        """
+        raise NotImplementedError()
+
+    def has_index(self) -> bool:
+        raise NotImplementedError()
+
+    def iter_index(self) -> Iterator[IndexEntry]:
+        """
+        :return: (date, digest, key) entries in insertion order
+        """
+        return (entry for _, entry in self.iter_index_positions())
+
+    def iter_index_positions(self, start_position: int=None) -> Iterator[Tuple[int, IndexEntry]]:
+        """
+        Index entries along with their positions, which only make sense to the backend and remain valid until the
+        index is saved again.
+
+        :param start_position: position of the first entry to be returned, from the beginning if None
+        :return: (position, (date, digest, key)) in insertion order
+        """
+        raise NotImplementedError()
+
+    def append_index(self, date_str: str, digest: str, key: str) -> int:
+        """
+        :return: position of the new entry
+        """
+        raise NotImplementedError()
+
+    def save_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        """
+        Replaces the whole index with the specified entries.
+
+        :param entries:
+        :return: position of the last entry, None if the index is empty
+        """
+        raise NotImplementedError()
+
+    def extend_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        """
+        Batched version of append_index().
+
+        :param entries:
+        :return: position of the last appended entry, None if no entry was appended
+        """
+        position = None
+        for date_str, digest, key in entries:
+            position = self.append_index(date_str, digest, key)
+
+        return position
+
+    def count_index(self) -> int:
+        raise NotImplementedError()
+
+    def load_meta(self, name: str) -> Optional[bytes]:
+        """
+        Auxiliary data kept alongside the index, such as the key filter.
+
+        :param name: short alphanumeric name
+        :return: saved data or None when missing
+        """
+        raise NotImplementedError()
+
+    def save_meta(self, name: str, data: bytes) -> None:
+        raise NotImplementedError()
+
+    def append_meta(self, name: str, data: bytes) -> None:
+        """
+        Appends data to an auxiliary data entry, typically a journal.
+
+        :param name:
+        :param data:
+        :return:
+        """
+        raise NotImplementedError()
+
+    def scan_values(self, pool_size: int=1) -> Tuple[Set[str], Set[str]]:
+        """
+        Lists stored values, independently from the index.
+
+        :param pool_size: number of threads scanning the storage
+        :return: digests of all stored values and digests of values stored at an unexpected location
+        """
+        raise NotImplementedError()
+
+    def repair_value(self, digest: str) -> None:
+        """
+        Moves a value reported as misplaced by scan_values() to its expected location.
+
+        :param digest:
+        :return:
+        """
+        pass
+
+    def rebalance(self, max_node_files: int, store_lock: Callable[[], ContextManager]) -> int:
+        """
+        Reorganizes the storage layout, only meaningful for the filesystem backend.
+
+        :param max_node_files: number of values above which a node gets divided
+        :param store_lock: factory of a context manager holding the store lock while values are moved around
+        :return: number of divided nodes
+        """
+        return 0
+
+    def clear(self) -> None:
+        """
+        Removes all values and the index.
+
+        :return:
+        """
+        raise NotImplementedError()
+
+
+class FileSystemBackend(StoreBackend):
+    """
+    One file per value named after its digest, the index being a text file at the root of the store, next to the
+    auxiliary data files named index.<name>.
+    Values are first saved at the root, which gets divided into two sub-nodes once it holds too many files, each
+    node being named after the highest digest it accepts.
+    """
+
+    INDEX_NAME = 'index'
+
+    def open(self) -> None:
+        self._store_path = osaccess.create_path_if_not_exists(self._store_path)
+
+    def _index_name(self) -> str:
+        return osaccess.build_file_path(self._store_path, self.INDEX_NAME)
+
+    def _find_node(self, digest: str, path: str=None) -> str:
+        if not path:
+            path = self._store_path
+
+        directories = osaccess.gen_directories_under(path)
+
+        if not directories:
+            return path
+
+        else:
+            target_directory = None
+            for directory_name in directories:
+                if digest <= directory_name:
+                    target_directory = directory_name
+                    break
+
+            if not target_directory:
+                raise Exception('Inconsistent store tree: expected directory "%s" not found', target_directory)
+
+            return self._find_node(digest, path=osaccess.build_directory_path(path, target_directory))
+
+    def value_location(self, digest: str) -> str:
+        return osaccess.build_file_path(self._find_node(digest), digest)
+
+    def has_value(self, digest: str) -> bool:
+        return osaccess.exists_path(self.value_location(digest))
+
+    def value_size(self, digest: str) -> Optional[int]:
+        return osaccess.get_file_bytes(self.value_location(digest))
+
+    def _build_node_resolver(self) -> Callable[[str], str]:
+        """
+        Equivalent of _find_node() listing each node only once, for batches during which the tree does not change.
+
+        :return: function returning the node path for a digest
+        """
+        nodes_directories = dict()
+
+        def resolve_node(digest: str) -> str:
+            path = self._store_path
+            while True:
+                if path not in nodes_directories:
+                    nodes_directories[path] = osaccess.gen_directories_under(path)
+
+                directories = nodes_directories[path]
+                if not directories:
+                    return path
+
+                target_directory = next((name for name in directories if digest <= name), None)
+                if target_directory is None:
+                    raise Exception('Inconsistent store tree: no directory found for digest "%s"', digest)
+
+                path = osaccess.build_directory_path(path, target_directory)
+
+        return resolve_node
+
+    def has_values(self, digests: Iterable[str]) -> Set[str]:
+        resolve_node = self._build_node_resolver()
+        nodes_files = dict()
+        stored_digests = set()
+        for digest in digests:
+            path = resolve_node(digest)
+            if path not in nodes_files:
+                nodes_files[path] = set(osaccess.gen_files_under(path))
+
+            if digest in nodes_files[path]:
+                stored_digests.add(digest)
+
+        return stored_digests
+
+    def load_value(self, digest: str) -> Optional[bytes]:
+        filename = self.value_location(digest)
+        try:
+            return osaccess.load_file_content(filename)
+
+        except FileNotFoundError:
+            return None
+
+    def save_value(self, digest: str, value: bytes) -> None:
+        osaccess.save_content(self.value_location(digest), value)
+
+    def save_values(self, values: Iterable[Tuple[str, bytes]]) -> None:
+        resolve_node = self._build_node_resolver()
+        for digest, value in values:
+            osaccess.save_content(osaccess.build_file_path(resolve_node(digest), digest), value)
+
+    def remove_value(self, digest: str) -> None:
+        osaccess.remove_file(self.value_location(digest))
+
+    def has_index(self) -> bool:
+        return osaccess.exists_path(self._index_name())
+
+    @staticmethod
+    def _parse_index_line(line: str) -> IndexEntry:
+        date_str, digest, key = line.strip().split(' ', 2)
+        return date_str, digest[:-1], key[1:-1]
+
+    @staticmethod
+    def _format_index_line(date_str: str, digest: str, key: str) -> str:
+        return '%s %s: "%s"\n' % (date_str, digest, key)
+
+    def iter_index_positions(self, start_position: int=None) -> Iterator[Tuple[int, IndexEntry]]:
+        if not self.has_index():
+            return
+
+        for position, line in osaccess.gen_file_lines_positions(self._index_name(), start_position or 0):
+            yield position, self._parse_index_line(line.decode('utf-8'))
+
+    def append_index(self, date_str: str, digest: str, key: str) -> int:
+        index_entry = self._format_index_line(date_str, digest, key)
+        return osaccess.append_content(self._index_name(), bytes(index_entry, 'utf-8'))
+
+    def save_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        lines = [bytes(self._format_index_line(*entry), 'utf-8') for entry in entries]
+        osaccess.save_content(self._index_name(), b''.join(lines))
+        if not lines:
+            return None
+
+        return sum(len(line) for line in lines[:-1])
+
+    def extend_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        lines = [bytes(self._format_index_line(*entry), 'utf-8') for entry in entries]
+        if not lines:
+            return None
+
+        position = osaccess.append_content(self._index_name(), b''.join(lines))
+        return position + sum(len(line) for line in lines[:-1])
+
+    def count_index(self) -> int:
+        if not self.has_index():
+            return 0
+
+        return osaccess.file_size(self._index_name())
+
+    def _meta_name(self, name: str) -> str:
+        return osaccess.build_file_path(self._store_path, '{}.{}'.format(self.INDEX_NAME, name))
+
+    def load_meta(self, name: str) -> Optional[bytes]:
+        try:
+            return osaccess.load_file_content(self._meta_name(name))
+
+        except FileNotFoundError:
+            return None
+
+    def save_meta(self, name: str, data: bytes) -> None:
+        temp_name = self._meta_name(name + '-tmp')
+        osaccess.save_content(temp_name, data)
+        osaccess.replace_path(temp_name, self._meta_name(name))
+
+    def append_meta(self, name: str, data: bytes) -> None:
+        osaccess.append_content(self._meta_name(name), data)
+
+    def _gen_node_files(self, path: str) -> Iterator[str]:
+        return (node for node in osaccess.gen_files_under(path) if not node.startswith(self.INDEX_NAME))
+
+    _DIGEST_LENGTH = 32
+    _DIGEST_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+    def _scan_node(self, node: Tuple[str, str, str]) -> Tuple[List[str], Set[str], List[Tuple[str, str, str]]]:
+        """
+        :param node: node path along with the bounds of the digests it accepts
+        :return: digests found in the node, misplaced ones and sub-nodes
+        """
+        path, lower_bound, upper_bound = node
+        directories = osaccess.gen_directories_under(path)
+        digests = [filename for filename in self._gen_node_files(path) if self._DIGEST_PATTERN.match(filename)]
+        if directories:
+            # values are only expected in leaf nodes
+            misplaced = set(digests)
+
+        else:
+            misplaced = {digest for digest in digests
+                         if not (lower_bound < digest and (upper_bound is None or digest <= upper_bound))}
+
+        sub_nodes = list()
+        sub_lower_bound = lower_bound
+        for directory in directories:
+            sub_nodes.append((osaccess.build_directory_path(path, directory), sub_lower_bound, directory))
+            sub_lower_bound = directory
+
+        return digests, misplaced, sub_nodes
+
+    def scan_values(self, pool_size: int=1) -> Tuple[Set[str], Set[str]]:
+        stored = set()
+        misplaced = set()
+        nodes = [(self._store_path, '', None)]
+        pool = ThreadPool(max(1, pool_size))
+        try:
+            while nodes:
+                next_nodes = list()
+                for node_digests, node_misplaced, sub_nodes in pool.map(self._scan_node, nodes):
+                    stored.update(node_digests)
+                    misplaced.update(node_misplaced)
+                    next_nodes += sub_nodes
+
+                nodes = next_nodes
+
+        finally:
+            pool.close()
+            pool.join()
+
+        return stored, misplaced
+
+    def _find_file(self, digest: str, path: str=None) -> Optional[str]:
+        if not path:
+            path = self._store_path
+
+        if digest in osaccess.gen_files_under(path):
+            return osaccess.build_file_path(path, digest)
+
+        for directory in osaccess.gen_directories_under(path):
+            file_path = self._find_file(digest, osaccess.build_directory_path(path, directory))
+            if file_path:
+                return file_path
+
+        return None
+
+    def repair_value(self, digest: str) -> None:
+        expected_path = self.value_location(digest)
+        file_path = self._find_file(digest)
+        if file_path and file_path != expected_path:
+            logging.info('moving misplaced value %s to %s', file_path, expected_path)
+            osaccess.rename_path(file_path, expected_path)
+
+    @staticmethod
+    def _divide_node(nodes_path: MutableSequence[str]) -> Tuple[str, str]:
+        """
+        A node is named after the highest digest it accepts and is divided into the two halves of its digest range.
+        Nodes created with 40 characters names are divided as their 32 characters prefix, as digests compare to both
+        in the same way.
+
+        :param nodes_path: names of the nodes leading to the node to be divided
+        :return: names of the two new sub-nodes
+        """
+        level = len(nodes_path)
+        if level > 0:
+            new_node_sup = nodes_path[-1][:FileSystemBackend._DIGEST_LENGTH]
+
+        else:
+            new_node_sup = 'f' * FileSystemBackend._DIGEST_LENGTH
+
+        half_range = 1 << (4 * FileSystemBackend._DIGEST_LENGTH - 1 - level)
+        new_node_inf = '{:032x}'.format(int(new_node_sup, 16) - half_range)
+        return new_node_inf, new_node_sup
+
+    def _plan_division(self, nodes_path: List[str], filenames: List[str],
+                       max_node_files: int) -> Tuple[List[List[str]], List[Tuple[List[str], List[str]]]]:
+        """
+        Divides a node as many times as required for each sub-node to hold at most max_node_files files.
+
+        :return: sub-nodes to be created and leaf sub-nodes along with the files they receive
+        """
+        new_node_inf, new_node_sup = self._divide_node(nodes_path)
+        files_inf = [filename for filename in filenames if filename <= new_node_inf]
+        files_sup = [filename for filename in filenames if filename > new_node_inf]
+        new_nodes = list()
+        leaves = list()
+        for new_node, new_node_files in ((new_node_inf, files_inf), (new_node_sup, files_sup)):
+            new_node_path = nodes_path + [new_node]
+            new_nodes.append(new_node_path)
+            if len(new_node_files) > max_node_files:
+                sub_nodes, sub_leaves = self._plan_division(new_node_path, new_node_files, max_node_files)
+                new_nodes += sub_nodes
+                leaves += sub_leaves
+
+            else:
+                leaves.append((new_node_path, new_node_files))
+
+        return new_nodes, leaves
+
+    def rebalance(self, max_node_files: int, store_lock: Callable[[], ContextManager],
+                  nodes_path: List[str]=None) -> int:
+        if not nodes_path:
+            nodes_path = list()
+
+        path = self._store_path
+        current_path = osaccess.merge_directory_paths([path], nodes_path)
+        files_node = self._gen_node_files(current_path)
+        rebalancing_required = sum(1 for _ in itertools.islice(files_node, max_node_files + 1)) > max_node_files
+        if rebalancing_required:
+            with store_lock():
+                logging.info('lock acquired: rebalancing started')
+                filenames = list(self._gen_node_files(current_path))
+                new_nodes, leaves = self._plan_division(nodes_path, filenames, max_node_files)
+                for new_node in new_nodes:
+                    new_node_path = osaccess.create_new_filepath(path, new_node[:-1], new_node[-1])
+                    logging.info('rebalancing required, creating node: %s', new_node_path)
+                    osaccess.create_path_if_not_exists(new_node_path)
+
+                for leaf, leaf_files in leaves:
+                    leaf_path = osaccess.create_new_filepath(path, leaf[:-1], leaf[-1])
+                    for filename in leaf_files:
+                        logging.debug('moving %s to %s', filename, leaf_path)
+                        osaccess.rename_path(osaccess.build_file_path(current_path, filename),
+                                             osaccess.build_file_path(leaf_path, filename))
+
+            logging.info('lock released: rebalancing completed')
+            # each division creating two sub-nodes
+            return len(new_nodes) // 2
+
+        count_divided = 0
+        for directory in osaccess.gen_directories_under(current_path):
+            count_divided += self.rebalance(max_node_files, store_lock, nodes_path + [directory])
+
+        return count_divided
+
+    def clear(self) -> None:
+        if osaccess.exists_path(self._store_path):
+            for node in osaccess.get_files_under_path(self._store_path):
+                node_path = osaccess.build_file_path(self._store_path, node)
+                osaccess.remove_all_under_path(node_path)
+
+
+class MemoryBackend(StoreBackend):
+    """
+    Keeps everything in memory, content is lost when the process exits.
+    Backends opened on the same store path share their content, auxiliary data being held as lists of appended chunks.
+    """
+
+    _stores = dict()
+    _stores_lock = threading.Lock()
+
+    def __init__(self, store_path: str):
+        StoreBackend.__init__(self, store_path)
+        self._values = None
+        self._index = None
+        self._meta = None
+
+    def open(self) -> None:
+        with MemoryBackend._stores_lock:
+            if self._store_path not in MemoryBackend._stores:
+                MemoryBackend._stores[self._store_path] = (dict(), list(), dict())
+
+            self._values, self._index, self._meta = MemoryBackend._stores[self._store_path]
+
+    def value_location(self, digest: str) -> str:
+        return 'memory://{}/{}'.format(self._store_path, digest)
+
+    def has_value(self, digest: str) -> bool:
+        return digest in self._values
+
+    def load_value(self, digest: str) -> Optional[bytes]:
+        return self._values.get(digest)
+
+    def save_value(self, digest: str, value: bytes) -> None:
+        self._values[digest] = bytes(value)
+
+    def remove_value(self, digest: str) -> None:
+        self._values.pop(digest, None)
+
+    def has_index(self) -> bool:
+        return len(self._index) > 0
+
+    def iter_index_positions(self, start_position: int=None) -> Iterator[Tuple[int, IndexEntry]]:
+        start_position = start_position or 0
+        return enumerate(self._index[start_position:], start_position)
+
+    def append_index(self, date_str: str, digest: str, key: str) -> int:
+        self._index.append((date_str, digest, key))
+        return len(self._index) - 1
+
+    def save_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        self._index[:] = list(entries)
+        if not self._index:
+            return None
+
+        return len(self._index) - 1
+
+    def extend_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        count_entries = len(self._index)
+        self._index.extend(entries)
+        if len(self._index) == count_entries:
+            return None
+
+        return len(self._index) - 1
+
+    def scan_values(self, pool_size: int=1) -> Tuple[Set[str], Set[str]]:
+        return set(self._values), set()
+
+    def count_index(self) -> int:
+        return len(self._index)
+
+    def load_meta(self, name: str) -> Optional[bytes]:
+        chunks = self._meta.get(name)
+        if chunks is None:
+            return None
+
+        return b''.join(chunks)
+
+    def save_meta(self, name: str, data: bytes) -> None:
+        self._meta[name] = [bytes(data)]
+
+    def append_meta(self, name: str, data: bytes) -> None:
+        self._meta.setdefault(name, list()).append(bytes(data))
+
+    def clear(self) -> None:
+        self._values.clear()
+        del self._index[:]
+        self._meta.clear()
+
+
+class SQLiteBackend(StoreBackend):
+    """
+    Values and index held in a single SQLite database, store_path being the database file.
+    Data appended to auxiliary entries is kept as separate journal rows until the entry is saved again.
+    """
+
+    def __init__(self, store_path: str):
+        StoreBackend.__init__(self, store_path)
+        self._lock = threading.RLock()
+        self._connection = None
+
+    def open(self) -> None:
+        self._store_path = os.path.abspath(self._store_path)
+        osaccess.create_path_if_not_exists(os.path.dirname(self._store_path))
+        with self._lock:
+            self._connection = sqlite3.connect(self._store_path, check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS store_values (digest TEXT PRIMARY KEY, value BLOB)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS store_index '
+                                     '(position INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, digest TEXT, key TEXT)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, data BLOB)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS store_meta_journal '
+                                     '(position INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, data BLOB)')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _fetch_one(self, query: str, params: tuple=()):
+        with self._lock:
+            return self._connection.execute(query, params).fetchone()
+
+    def value_location(self, digest: str) -> str:
+        return '{}#{}'.format(self._store_path, digest)
+
+    def has_value(self, digest: str) -> bool:
+        return self._fetch_one('SELECT 1 FROM store_values WHERE digest = ?', (digest,)) is not None
+
+    def value_size(self, digest: str) -> Optional[int]:
+        row = self._fetch_one('SELECT LENGTH(value) FROM store_values WHERE digest = ?', (digest,))
+        if row is None:
+            return None
+
+        return row[0]
+
+    def has_values(self, digests: Iterable[str]) -> Set[str]:
+        digests = list(digests)
+        stored_digests = set()
+        batch_size = 500
+        with self._lock:
+            for offset in range(0, len(digests), batch_size):
+                batch = digests[offset:offset + batch_size]
+                query = 'SELECT digest FROM store_values WHERE digest IN ({})'.format(', '.join('?' * len(batch)))
+                stored_digests.update(row[0] for row in self._connection.execute(query, batch))
+
+        return stored_digests
+
+    def load_value(self, digest: str) -> Optional[bytes]:
+        row = self._fetch_one('SELECT value FROM store_values WHERE digest = ?', (digest,))
+        if row is None:
+            return None
+
+        return bytes(row[0])
+
+    def save_value(self, digest: str, value: bytes) -> None:
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO store_values (digest, value) VALUES (?, ?)',
+                                     (digest, sqlite3.Binary(value)))
+
+    def remove_value(self, digest: str) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM store_values WHERE digest = ?', (digest,))
+
+    def has_index(self) -> bool:
+        return self._fetch_one('SELECT 1 FROM store_index LIMIT 1') is not None
+
+    def iter_index_positions(self, start_position: int=None) -> Iterator[Tuple[int, IndexEntry]]:
+        with self._lock:
+            rows = self._connection.execute('SELECT position, date, digest, key FROM store_index '
+                                            'WHERE position >= ? ORDER BY position', (start_position or 0,)).fetchall()
+
+        return ((row[0], tuple(row[1:])) for row in rows)
+
+    def append_index(self, date_str: str, digest: str, key: str) -> int:
+        with self._lock:
+            cursor = self._connection.execute('INSERT INTO store_index (date, digest, key) VALUES (?, ?, ?)',
+                                              (date_str, digest, key))
+            return cursor.lastrowid
+
+    def save_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.execute('DELETE FROM store_index')
+                self._connection.executemany('INSERT INTO store_index (date, digest, key) VALUES (?, ?, ?)', entries)
+                last_position = self._connection.execute('SELECT MAX(position) FROM store_index').fetchone()[0]
+                self._connection.execute('COMMIT')
+
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+        return last_position
+
+    def extend_index(self, entries: Iterable[IndexEntry]) -> Optional[int]:
+        entries = list(entries)
+        if not entries:
+            return None
+
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany('INSERT INTO store_index (date, digest, key) VALUES (?, ?, ?)', entries)
+                last_position = self._connection.execute('SELECT MAX(position) FROM store_index').fetchone()[0]
+                self._connection.execute('COMMIT')
+
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+        return last_position
+
+    def save_values(self, values: Iterable[Tuple[str, bytes]]) -> None:
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany('INSERT OR REPLACE INTO store_values (digest, value) VALUES (?, ?)',
+                                             ((digest, sqlite3.Binary(value)) for digest, value in values))
+                self._connection.execute('COMMIT')
+
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def scan_values(self, pool_size: int=1) -> Tuple[Set[str], Set[str]]:
+        with self._lock:
+            rows = self._connection.execute('SELECT digest FROM store_values').fetchall()
+
+        return {row[0] for row in rows}, set()
+
+    def count_index(self) -> int:
+        return self._fetch_one('SELECT COUNT(*) FROM store_index')[0]
+
+    def load_meta(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute('SELECT data FROM store_meta WHERE name = ?', (name,)).fetchone()
+            journal = self._connection.execute('SELECT data FROM store_meta_journal WHERE name = ? ORDER BY position',
+                                               (name,)).fetchall()
+
+        if row is None and not journal:
+            return None
+
+        chunks = [bytes(row[0])] if row is not None else list()
+        chunks.extend(bytes(journal_row[0]) for journal_row in journal)
+        return b''.join(chunks)
+
+    def save_meta(self, name: str, data: bytes) -> None:
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.execute('DELETE FROM store_meta_journal WHERE name = ?', (name,))
+                self._connection.execute('INSERT OR REPLACE INTO store_meta (name, data) VALUES (?, ?)',
+                                         (name, sqlite3.Binary(data)))
+                self._connection.execute('COMMIT')
+
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def append_meta(self, name: str, data: bytes) -> None:
+        with self._lock:
+            self._connection.execute('INSERT INTO store_meta_journal (name, data) VALUES (?, ?)',
+                                     (name, sqlite3.Binary(data)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM store_values')
+            self._connection.execute('DELETE FROM store_index')
+            self._connection.execute('DELETE FROM store_meta')
+            self._connection.execute('DELETE FROM store_meta_journal')
+
+
+__backends = {
+    'filesystem': FileSystemBackend,
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def register_backend(name: str, backend_class: Callable[[str], StoreBackend]) -> None:
+    __backends[name] = backend_class
+
+
+def create_backend(name: str, store_path: str) -> StoreBackend:
+    """
+
+    :param name: one of 'filesystem', 'memory', 'sqlite' or any name added with register_backend()
+    :param store_path: location of the store, the database file for the sqlite backend
+    :return: opened backend
+    """
+    if name not in __backends:
+        raise ValueError('unknown store backend "{}", expected one of: {}'.format(name, ', '.join(sorted(__backends))))
+
+    backend = __backends[name](store_path)
+    backend.open()
+    return backend
@@ -1,6 +1,14 @@
 import logging
+import threading
 from multiprocessing.pool import ThreadPool
 
+from webscrapetools import metrics
+
+_METRIC_QUEUE_DEPTH = metrics.gauge('webscrapetools_taskpool_queue_depth', 'Tasks added to a pool and not started yet')
+_METRIC_TASK_DURATION = metrics.histogram('webscrapetools_taskpool_task_seconds', 'Duration of pool tasks')
+_METRIC_TASK_FAILURES = metrics.counter('webscrapetools_taskpool_task_failures_total',
+                                        'Pool tasks failing after their retry')
+
 
 class TaskPool(object):
     """
@@ -15,9 +23,34 @@ class TaskPool(object):
         self._pool_size = pool_size
         self._pool = ThreadPool(pool_size)
         self._tasks_args = list()
+        self._lock = threading.Lock()
+        self._count_queued = 0
+
+    def __del__(self):
+        self._discard_queued()
+
+    def _discard_queued(self) -> None:
+        """
+        Removes tasks never started from the queue depth, as when the pool is discarded without being executed.
+
+        :return:
+        """
+        with self._lock:
+            count_queued = self._count_queued
+            self._count_queued = 0
+
+        _METRIC_QUEUE_DEPTH.dec(count_queued)
+
+    def _task_function_wrapper(self, single_param):
+        with self._lock:
+            self._count_queued -= 1
+
+        _METRIC_QUEUE_DEPTH.dec()
+        with _METRIC_TASK_DURATION.time():
+            return TaskPool._run_task(single_param)
 
     @staticmethod
-    def _task_function_wrapper(single_param):
+    def _run_task(single_param):
         wrapped_task, wrapped_task_id, wrapped_args, wrapped_kwargs = single_param
         try:
             result = wrapped_task(*wrapped_args, **wrapped_kwargs)
@@ -34,6 +67,7 @@ class TaskPool(object):
                 logging.error('task %d (%s, %s, %s) failed twice: %s',
                               wrapped_task_id, wrapped_task, wrapped_args, wrapped_kwargs,
                               err_2, exc_info=True)
+                _METRIC_TASK_FAILURES.inc()
                 raise
 
         return result
@@ -48,6 +82,10 @@ class TaskPool(object):
         """
         task_id = len(self._tasks_args) + 1
         self._tasks_args.append((task_function, task_id, args, kwargs))
+        with self._lock:
+            self._count_queued += 1
+
+        _METRIC_QUEUE_DEPTH.inc()
 
     def execute(self):
         """
@@ -55,15 +93,20 @@ class TaskPool(object):
         :return:
         """
         logging.info('processing %d tasks on a pool size of %d', len(self._tasks_args), self._pool_size)
-        if self._pool_size == 1:
-            for task_args in self._tasks_args:
-                result = TaskPool._task_function_wrapper(task_args)
-                yield result
-
-        else:
-            results = self._pool.map(TaskPool._task_function_wrapper, self._tasks_args)
-            for result in results:
-                yield result
+        try:
+            if self._pool_size == 1:
+                for task_args in self._tasks_args:
+                    result = self._task_function_wrapper(task_args)
+                    yield result
+
+            else:
+                results = self._pool.map(self._task_function_wrapper, self._tasks_args)
+                for result in results:
+                    yield result
+
+        finally:
+            # tasks left when the results are not consumed entirely
+            self._discard_queued()
 
         self._pool.close()
         self._pool.join()
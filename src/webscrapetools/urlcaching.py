@@ -13,28 +13,58 @@ Subsequent calls for the same URL returns the cached data:
     >>> first_call_response == second_call_response
     True
 
+
+URLs known in advance can be downloaded in the background, later calls to open_url() then hitting the cache:
+    >>> handle = prefetch(['https://www.google.ch/search?q=what+time+is+it'], concurrency=4)
+    >>> handle.done.result().completed
+    1
+
+Expired entries kept as stale can be served immediately while being refreshed in the background:
+    >>> set_cache_path('./example-cache', expiry_days=1, stale_days=2)
+    >>> response = open_url('https://www.google.ch/search?q=what+time+is+it', stale_while_revalidate=True)
+
 """
 import logging
-from time import sleep
-from typing import Callable
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from time import sleep, perf_counter
+from typing import Callable, Iterable, Dict, Optional
 
 import requests
 
+from webscrapetools import metrics
 from webscrapetools.keyvalue import set_store_path, empty_store, get_store_id, remove_from_store, \
-    has_store_key, is_store_enabled, add_to_store, retrieve_from_store
+    has_store_key, has_store_keys, is_store_enabled, add_to_store, retrieve_from_store, retrieve_fresh_from_store
 
 
 __all__ = ['open_url', 'set_cache_path', 'empty_cache', 'get_cache_filename', 'invalidate_key', 'is_cached',
-           'read_cached', 'set_headers_browser']
+           'read_cached', 'set_headers_browser', 'prefetch', 'PrefetchHandle', 'set_refresh_workers',
+           'wait_pending_refreshes']
 
 __HEADERS_CHROME = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'}
 
 
 __web_client = None
 __last_request = None
+__refresh_executor = None
+__refresh_workers = 4
+__refresh_futures = dict()  # type: Dict[str, Future]
+__refresh_lock = threading.Lock()
 
 _headers_browser = __HEADERS_CHROME
 
+_METRIC_HITS = metrics.counter('webscrapetools_read_cached_hits_total', 'Cache hits in read_cached')
+_METRIC_MISSES = metrics.counter('webscrapetools_read_cached_misses_total', 'Cache misses in read_cached')
+_METRIC_HIT_LATENCY = metrics.histogram('webscrapetools_read_cached_hit_seconds', 'Latency of read_cached hits')
+_METRIC_MISS_LATENCY = metrics.histogram('webscrapetools_read_cached_miss_seconds', 'Latency of read_cached misses')
+_METRIC_FETCH_LATENCY = metrics.histogram('webscrapetools_fetch_seconds', 'Latency of remote calls in open_url')
+_METRIC_PREFETCHED = metrics.counter('webscrapetools_prefetched_total', 'Urls downloaded in the background by prefetch')
+_METRIC_STALE_HITS = metrics.counter('webscrapetools_read_cached_stale_total',
+                                     'Stale entries served by read_cached while being refreshed')
+_METRIC_REFRESHES = metrics.counter('webscrapetools_refreshes_total', 'Stale entries refreshed in the background')
+_METRIC_REFRESH_FAILURES = metrics.counter('webscrapetools_refresh_failures_total',
+                                           'Background refreshes of stale entries that failed')
+
 
 def set_headers_browser(headers):
     global _headers_browser
@@ -45,8 +75,12 @@ def _get_headers_browser():
     return _headers_browser
 
 
-def set_cache_path(cache_file_path, max_node_files=None, rebalancing_limit=None, expiry_days=10):
-    set_store_path(cache_file_path, max_node_files, rebalancing_limit, expiry_days)
+def set_cache_path(cache_file_path, max_node_files=None, rebalancing_limit=None, expiry_days=10, backend='filesystem',
+                   content_addressed=None, max_bytes=None, max_entries=None, eviction_policy='lru', stale_days=None,
+                   key_hash=None):
+    set_store_path(cache_file_path, max_node_files, rebalancing_limit, expiry_days, backend=backend,
+                   content_addressed=content_addressed, max_bytes=max_bytes, max_entries=max_entries,
+                   eviction_policy=eviction_policy, key_hash=key_hash, stale_periods=stale_days)
 
 
 def invalidate_key(key):
@@ -89,19 +123,41 @@ def get_last_request():
     return __last_request
 
 
-def read_cached(read_func: Callable[[str], str], key: str) -> str:
+def read_cached(read_func: Callable[[str], str], key: str, stale_while_revalidate: bool=False) -> str:
     """
     :param read_func: function getting the data that will be cached
     :param key: key associated to the cache entry
+    :param stale_while_revalidate: returning expired entries still within the stale period set with set_cache_path()
+    immediately, read_func being called in the background for refreshing them; otherwise cached entries are returned
+    until removed by invalidate_expired_entries()
     :return:
     """
     logging.debug('reading for key: %s', key)
     if is_store_enabled():
-        if not has_store_key(key):
+        start = perf_counter()
+        # a single lookup, misses being answered by the key filter
+        if stale_while_revalidate:
+            stored_content, is_stale = retrieve_fresh_from_store(key)
+
+        else:
+            stored_content, is_stale = retrieve_from_store(key), False
+
+        if stored_content is None:
             content = read_func(key)
             add_to_store(key, bytes(content, 'utf-8'))
+            _METRIC_MISSES.inc()
+            latency_metric = _METRIC_MISS_LATENCY
+
+        else:
+            content = stored_content.decode('utf-8')
+            if is_stale:
+                _queue_refresh(read_func, key)
+                _METRIC_STALE_HITS.inc()
+
+            _METRIC_HITS.inc()
+            latency_metric = _METRIC_HIT_LATENCY
 
-        content = retrieve_from_store(key).decode('utf-8')
+        latency_metric.observe(perf_counter() - start)
 
     else:
         # straight access
@@ -110,7 +166,76 @@ def read_cached(read_func: Callable[[str], str], key: str) -> str:
     return content
 
 
-def open_url(url, rejection_marker=None, throttle=None, init_client_func=None, call_client_func=None):
+def set_refresh_workers(count_workers: int) -> None:
+    """
+    Number of threads refreshing stale entries in the background, applying to refreshes queued afterwards.
+
+    :param count_workers:
+    :return:
+    """
+    global __refresh_executor
+    global __refresh_workers
+    with __refresh_lock:
+        __refresh_workers = count_workers
+        if __refresh_executor is not None:
+            __refresh_executor.shutdown(wait=False)
+            __refresh_executor = None
+
+
+def _refresh(read_func: Callable[[str], str], key: str) -> None:
+    content = read_func(key)
+    add_to_store(key, bytes(content, 'utf-8'))
+    _METRIC_REFRESHES.inc()
+
+
+def _refresh_done(key: str, future: Future) -> None:
+    with __refresh_lock:
+        __refresh_futures.pop(key, None)
+
+    if not future.cancelled() and future.exception() is not None:
+        logging.warning('refresh failed for key %s: %s', key, future.exception())
+        _METRIC_REFRESH_FAILURES.inc()
+
+
+def _queue_refresh(read_func: Callable[[str], str], key: str) -> None:
+    """
+    Refreshes the entry in the background, unless a refresh is already pending for that key.
+
+    :param read_func:
+    :param key:
+    :return:
+    """
+    global __refresh_executor
+    with __refresh_lock:
+        if key in __refresh_futures:
+            return
+
+        if __refresh_executor is None:
+            __refresh_executor = ThreadPoolExecutor(max_workers=__refresh_workers, thread_name_prefix='refresh')
+
+        logging.debug('queuing refresh for stale key: %s', key)
+        future = __refresh_executor.submit(_refresh, read_func, key)
+        __refresh_futures[key] = future
+
+    future.add_done_callback(lambda done_future: _refresh_done(key, done_future))
+
+
+def wait_pending_refreshes(timeout: Optional[float]=None) -> None:
+    """
+    Blocks until refreshes of stale entries queued so far are completed.
+
+    :param timeout: maximum number of seconds to wait for, raises concurrent.futures.TimeoutError when exceeded
+    :return:
+    """
+    with __refresh_lock:
+        futures = list(__refresh_futures.values())
+
+    for future in as_completed(futures, timeout):
+        pass
+
+
+def open_url(url, rejection_marker=None, throttle=None, init_client_func=None, call_client_func=None,
+             stale_while_revalidate=False):
     """
     Opens specified url. Caching is used if initialized with set_cache_path().
     :param url: target url
@@ -118,8 +243,16 @@ def open_url(url, rejection_marker=None, throttle=None, init_client_func=None, c
     :param throttle: waiting period before sending request
     :param init_client_func(): function that returns a web client instance
     :param call_client_func(web_client): function that handles a call through the web client and returns (response content, last request)
+    :param stale_while_revalidate: serving stale cached responses while downloading them again in the background
     :return: remote response as text
     """
+    _init_client(init_client_func)
+    content = read_cached(_build_url_reader(rejection_marker, throttle, call_client_func), url,
+                          stale_while_revalidate=stale_while_revalidate)
+    return content
+
+
+def _init_client(init_client_func=None):
     global __web_client
 
     if __web_client is None:
@@ -129,26 +262,166 @@ def open_url(url, rejection_marker=None, throttle=None, init_client_func=None, c
         else:
             __web_client = init_client_func()
 
+
+def _build_url_reader(rejection_marker=None, throttle=None, call_client_func=None) -> Callable[[str], str]:
+
     def inner_open_url(request_url):
         global __last_request
         if throttle:
             sleep(throttle)
 
-        if call_client_func is None:
-            response = __web_client.get(request_url, headers=_get_headers_browser())
-            response_text = response.text
-            __last_request = response.request
+        with _METRIC_FETCH_LATENCY.time():
+            if call_client_func is None:
+                response = __web_client.get(request_url, headers=_get_headers_browser())
+                response_text = response.text
+                __last_request = response.request
 
-        else:
-            response_text, __last_request = call_client_func(__web_client, request_url)
+            else:
+                response_text, __last_request = call_client_func(__web_client, request_url)
 
         if rejection_marker is not None and rejection_marker in response_text:
             raise RuntimeError('rejected, failed to load url %s', request_url)
 
         return response_text
 
-    content = read_cached(inner_open_url, url)
-    return content
+    return inner_open_url
+
+
+class PrefetchHandle(object):
+    """
+    Tracks urls being downloaded in the background by prefetch().
+    """
+
+    def __init__(self, count_urls: int, count_cached: int):
+        self._lock = threading.Lock()
+        self._count_urls = count_urls
+        self._count_cached = count_cached
+        self._count_completed = 0
+        self._count_failed = 0
+        self._executor = None
+        self.futures = dict()  # type: Dict[str, Future]
+        self.done = Future()
+
+    @property
+    def total(self) -> int:
+        return self._count_urls
+
+    @property
+    def cached(self) -> int:
+        """
+        :return: number of urls already in cache when the prefetch started
+        """
+        return self._count_cached
+
+    @property
+    def completed(self) -> int:
+        return self._count_completed
+
+    @property
+    def failed(self) -> int:
+        return self._count_failed
+
+    def progress(self) -> float:
+        """
+        :return: fraction of urls processed so far, including the ones already in cache
+        """
+        if self._count_urls == 0:
+            return 1.
+
+        return (self._count_cached + self._count_completed + self._count_failed) / self._count_urls
+
+    def wait(self, timeout: float=None) -> 'PrefetchHandle':
+        """
+        Blocks until all downloads are processed.
+
+        :param timeout: maximum number of seconds to wait for, raises concurrent.futures.TimeoutError when exceeded
+        :return:
+        """
+        return self.done.result(timeout)
+
+    def cancel(self) -> None:
+        """
+        Cancels downloads not started yet.
+
+        :return:
+        """
+        for future in list(self.futures.values()):
+            future.cancel()
+
+    def _start(self, executor: ThreadPoolExecutor, fetch_func: Callable[[str], None], urls: Iterable[str]) -> None:
+        self._executor = executor
+        for url in urls:
+            self.futures[url] = executor.submit(fetch_func, url)
+
+        for url, future in self.futures.items():
+            future.add_done_callback(lambda completed_future, done_url=url: self._task_done(done_url,
+                                                                                            completed_future))
+
+    def _task_done(self, url: str, future: Future) -> None:
+        if future.cancelled():
+            logging.debug('prefetch cancelled for url %s', url)
+            failed = True
+
+        elif future.exception() is not None:
+            logging.warning('prefetch failed for url %s: %s', url, future.exception())
+            failed = True
+
+        else:
+            failed = False
+
+        with self._lock:
+            if failed:
+                self._count_failed += 1
+
+            else:
+                self._count_completed += 1
+
+            is_finished = self._count_completed + self._count_failed == len(self.futures)
+
+        if is_finished:
+            self._executor.shutdown(wait=False)
+            self.done.set_result(self)
+
+
+def prefetch(urls: Iterable[str], concurrency: int=8, throttle=None, rejection_marker=None, init_client_func=None,
+             call_client_func=None) -> PrefetchHandle:
+    """
+    Downloads in the background the specified urls missing from the cache, so that subsequent calls to open_url()
+    hit the cache. Requires caching to be initialized with set_cache_path().
+
+    :param urls: target urls
+    :param concurrency: number of simultaneous downloads
+    :param throttle: waiting period before sending each request
+    :param rejection_marker: fails the download if response contains specified marker
+    :param init_client_func(): function that returns a web client instance
+    :param call_client_func(web_client): function that handles a call through the web client and returns (response content, last request)
+    :return: handle giving access to progress and completion futures
+    """
+    if not is_store_enabled():
+        raise RuntimeError('prefetching requires caching to be enabled using set_cache_path()')
+
+    urls = list(dict.fromkeys(urls))
+    missing_urls = [url for url, is_stored in zip(urls, has_store_keys(urls)) if not is_stored]
+    logging.info('prefetching %d urls out of %d', len(missing_urls), len(urls))
+    handle = PrefetchHandle(len(urls), len(urls) - len(missing_urls))
+    if not missing_urls:
+        handle.done.set_result(handle)
+        return handle
+
+    _init_client(init_client_func)
+    read_url = _build_url_reader(rejection_marker, throttle, call_client_func)
+
+    def fetch_url(url: str) -> None:
+        if has_store_key(url):
+            return
+
+        content = read_url(url)
+        add_to_store(url, bytes(content, 'utf-8'))
+        _METRIC_PREFETCHED.inc()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prefetch')
+    handle._start(executor, fetch_url, missing_urls)
+    return handle
 
 
 def reset_client():
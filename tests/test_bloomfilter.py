@@ -0,0 +1,66 @@
+import hashlib
+import logging
+import unittest
+
+from webscrapetools import metrics
+from webscrapetools.bloomfilter import BloomFilter
+from webscrapetools.keyvalue import set_store_path, add_to_store, has_store_key, remove_from_store, empty_store, \
+    retrieve_from_store
+from webscrapetools.storage import create_backend
+
+
+def _digest(value) -> str:
+    return hashlib.md5(repr(value).encode('utf-8')).hexdigest()
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_membership(self):
+        bloom_filter = BloomFilter.from_digests((_digest(count) for count in range(1000)), capacity=1000)
+        self.assertEqual(1000, bloom_filter.count)
+        self.assertTrue(all(_digest(count) in bloom_filter for count in range(1000)))
+        false_positives = sum(1 for count in range(1000, 11000) if _digest(count) in bloom_filter)
+        self.assertLess(false_positives, 300)
+
+    def test_serialization(self):
+        bloom_filter = BloomFilter.from_digests((_digest(count) for count in range(100)), capacity=200)
+        loaded_filter = BloomFilter.from_bytes(bloom_filter.to_bytes())
+        self.assertEqual(100, loaded_filter.count)
+        self.assertEqual(200, loaded_filter.capacity)
+        self.assertTrue(all(_digest(count) in loaded_filter for count in range(100)))
+        self.assertIsNone(BloomFilter.from_bytes(bloom_filter.to_bytes()[:-1]))
+        self.assertIsNone(BloomFilter.from_bytes(None))
+
+    def test_store_filter(self):
+        set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30)
+        empty_store()
+        for count in range(50):
+            add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+        metrics.reset_metrics()
+        self.assertTrue(has_store_key('10'))
+        self.assertFalse(has_store_key('missing'))
+        self.assertIsNone(retrieve_from_store('missing'))
+        self.assertEqual(2, metrics.snapshot()['webscrapetools_store_filter_negatives_total'])
+
+        remove_from_store('10')
+        self.assertFalse(has_store_key('10'))
+
+        # reopening the store rebuilds the persisted filter when it is out of date
+        backend = create_backend('filesystem', './output/tests')
+        self.assertEqual(49, BloomFilter.from_bytes(backend.load_meta('filter')).count)
+        add_to_store('50', b'50')
+        set_store_path('./output/tests')
+        self.assertTrue(has_store_key('50'))
+        self.assertTrue(has_store_key('20'))
+        self.assertFalse(has_store_key('10'))
+        empty_store()
+
+    def tearDown(self):
+        set_store_path('./output/tests')
+        empty_store()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    unittest.main()
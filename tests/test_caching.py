@@ -1,17 +1,24 @@
+import hashlib
 import logging
 import os
 import random
+import subprocess
+import sys
+import textwrap
+import time
 import unittest
 from datetime import datetime
 from datetime import timedelta
 
+import webscrapetools
 from webscrapetools.keyvalue import invalidate_expired_entries, set_store_path, add_to_store, retrieve_from_store, \
     remove_from_store, list_keys, empty_store
 from webscrapetools.osaccess import gen_directories_under, gen_files_under
+from webscrapetools.storage import create_backend
 from webscrapetools.taskpool import TaskPool
 
 from webscrapetools.urlcaching import set_cache_path, read_cached, empty_cache, is_cached, \
-    get_cache_filename, open_url
+    get_cache_filename, open_url, prefetch, reset_client, wait_pending_refreshes
 
 
 class TestUrlCaching(unittest.TestCase):
@@ -75,6 +82,14 @@ class TestUrlCaching(unittest.TestCase):
         self.assertEqual(os.path.abspath('output/tests/bc4e44260919ea00a59f7a9dc75e73e3'), value)
         empty_cache()
 
+    def test_cache_key_hash(self):
+        set_cache_path('./output/tests', key_hash='blake2b')
+        empty_cache()
+        digest = hashlib.blake2b(repr('my content').encode('utf-8'), digest_size=16).hexdigest()
+        self.assertEqual(os.path.abspath(os.path.join('output/tests', digest)), get_cache_filename('my content'))
+        empty_cache()
+        set_cache_path('./output/tests', key_hash='md5')
+
     def test_cache_example(self):
         set_cache_path('./output/tests', max_node_files=10, rebalancing_limit=100)
         empty_cache()
@@ -91,6 +106,123 @@ class TestUrlCaching(unittest.TestCase):
 
         empty_cache()
 
+    def test_prefetch(self):
+        set_cache_path('./output/tests', max_node_files=10, rebalancing_limit=100)
+        empty_cache()
+        reset_client()
+        calls = list()
+
+        def dummy_client():
+            return None
+
+        def dummy_call(_, dummy_key):
+            calls.append(dummy_key)
+            if dummy_key == 'failing':
+                raise RuntimeError('failing call')
+
+            return 'content ' + dummy_key, dummy_key
+
+        open_url('00000', init_client_func=dummy_client, call_client_func=dummy_call)
+        urls = ['{:05d}'.format(count) for count in range(200)] + ['00010', 'failing']
+        handle = prefetch(urls, concurrency=8, init_client_func=dummy_client, call_client_func=dummy_call)
+        self.assertIs(handle, handle.wait(timeout=30))
+        self.assertEqual(201, handle.total)
+        self.assertEqual(1, handle.cached)
+        self.assertEqual(199, handle.completed)
+        self.assertEqual(1, handle.failed)
+        self.assertEqual(1., handle.progress())
+        self.assertIsNotNone(handle.futures['failing'].exception())
+
+        calls.clear()
+        for url in urls[:200]:
+            self.assertEqual('content ' + url, open_url(url, init_client_func=dummy_client,
+                                                         call_client_func=dummy_call))
+
+        self.assertListEqual([], calls)
+        handle = prefetch(urls[:200])
+        self.assertTrue(handle.done.done())
+        self.assertEqual(200, handle.cached)
+        reset_client()
+        empty_cache()
+
+    def test_stale_while_revalidate(self):
+        set_store_path('./output/tests', expiry_periods=1, expiry_unit='second', stale_periods=60)
+        empty_cache()
+        versions = {'key': 0}
+
+        def read_versioned_value(key: str) -> str:
+            versions[key] += 1
+            return 'version {}'.format(versions[key])
+
+        self.assertEqual('version 1', read_cached(read_versioned_value, 'key', stale_while_revalidate=True))
+        time.sleep(1.2)
+
+        # stale entry served while being refreshed in the background
+        self.assertEqual('version 1', read_cached(read_versioned_value, 'key', stale_while_revalidate=True))
+        wait_pending_refreshes(timeout=10)
+        self.assertEqual('version 2', read_cached(read_versioned_value, 'key', stale_while_revalidate=True))
+
+        # stale entry returned as is otherwise
+        time.sleep(1.2)
+        self.assertEqual('version 2', read_cached(read_versioned_value, 'key'))
+
+        # refreshed entries are kept when invalidating expired ones
+        invalidate_expired_entries(as_of_date=datetime.now() + timedelta(seconds=30))
+        self.assertTrue(is_cached('key'))
+        invalidate_expired_entries(as_of_date=datetime.now() + timedelta(days=2))
+        self.assertFalse(is_cached('key'))
+        empty_cache()
+
+    def test_stale_refresh_restart(self):
+        set_store_path('./output/tests')
+        empty_cache()
+        # store released, entries being written by another process
+        set_store_path('tests', backend='memory')
+        keys = ['k{}'.format(count) for count in range(5)]
+        backend = create_backend('filesystem', './output/tests')
+        backend.clear()
+        date_str = (datetime.today() - timedelta(days=20)).strftime('%Y%m%d')
+        digests = [hashlib.md5(repr(key).encode('utf-8')).hexdigest() for key in keys]
+        for key, digest in zip(keys, digests):
+            backend.save_value(digest, bytes('stale ' + key, 'utf-8'))
+
+        backend.save_index((date_str, digest, key) for key, digest in zip(keys, digests))
+        backend.close()
+
+        # refreshes survive a process exiting without saving the store state
+        source_path = os.path.dirname(os.path.dirname(os.path.abspath(webscrapetools.__file__)))
+        subprocess.run([sys.executable, '-c', textwrap.dedent('''
+            import os
+            from webscrapetools.keyvalue import add_to_store
+            from webscrapetools.urlcaching import set_cache_path, read_cached, wait_pending_refreshes
+            set_cache_path('./output/tests', expiry_days=10, stale_days=15)
+            add_to_store('k0', b'fresh k0')
+            read_cached(lambda key: 'fresh ' + key, 'k1', stale_while_revalidate=True)
+            wait_pending_refreshes(timeout=10)
+            os._exit(0)
+            ''')], env=dict(os.environ, PYTHONPATH=source_path), check=True)
+
+        set_cache_path('./output/tests', expiry_days=10, stale_days=15)
+        calls = list()
+
+        def read_value(key: str) -> str:
+            calls.append(key)
+            return 'fresh ' + key
+
+        self.assertEqual('fresh k0', read_cached(read_value, 'k0', stale_while_revalidate=True))
+        self.assertEqual('fresh k1', read_cached(read_value, 'k1', stale_while_revalidate=True))
+        wait_pending_refreshes(timeout=10)
+        self.assertListEqual([], calls)
+        self.assertEqual('stale k2', read_cached(read_value, 'k2', stale_while_revalidate=True))
+        wait_pending_refreshes(timeout=10)
+        self.assertListEqual(['k2'], calls)
+
+        # refreshed entries outlive their index date
+        invalidate_expired_entries(as_of_date=datetime.now() + timedelta(days=10))
+        self.assertTrue(is_cached('k0'))
+        self.assertFalse(is_cached('k3'))
+        empty_cache()
+
     def test_store(self):
         set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30)
         empty_store()
@@ -0,0 +1,92 @@
+import logging
+import unittest
+
+from webscrapetools import metrics
+from webscrapetools.metrics import MetricsRegistry
+from webscrapetools.taskpool import TaskPool
+from webscrapetools.urlcaching import set_cache_path, read_cached, empty_cache
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_registry(self):
+        registry = MetricsRegistry()
+        hits = registry.counter('test_hits_total', 'Test hits')
+        hits.inc()
+        hits.inc(2)
+        self.assertIs(hits, registry.counter('test_hits_total'))
+        with self.assertRaises(ValueError):
+            registry.gauge('test_hits_total')
+
+        latency = registry.histogram('test_latency_seconds', buckets=(0.1, 1.))
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5.)
+
+        values = registry.snapshot()
+        self.assertEqual(3, values['test_hits_total'])
+        self.assertEqual(3, values['test_latency_seconds']['count'])
+        self.assertAlmostEqual(5.55, values['test_latency_seconds']['sum'])
+        self.assertDictEqual({'0.1': 1, '1.0': 2, '+Inf': 3}, values['test_latency_seconds']['buckets'])
+
+        exported = registry.to_prometheus().splitlines()
+        self.assertIn('# HELP test_hits_total Test hits', exported)
+        self.assertIn('# TYPE test_hits_total counter', exported)
+        self.assertIn('test_hits_total 3', exported)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 2', exported)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 3', exported)
+        self.assertIn('test_latency_seconds_count 3', exported)
+
+        registry.reset()
+        self.assertEqual(0, registry.snapshot()['test_hits_total'])
+        self.assertEqual(0, registry.snapshot()['test_latency_seconds']['count'])
+
+    def test_read_cached_metrics(self):
+        set_cache_path('./output/tests', max_node_files=10, rebalancing_limit=30)
+        empty_cache()
+        metrics.reset_metrics()
+        for count in range(20):
+            read_cached(lambda key: 'content for key %s' % key, key=str(count % 10))
+
+        values = metrics.snapshot()
+        self.assertEqual(10, values['webscrapetools_read_cached_misses_total'])
+        self.assertEqual(10, values['webscrapetools_read_cached_hits_total'])
+        self.assertEqual(10, values['webscrapetools_read_cached_hit_seconds']['count'])
+        self.assertEqual(10, values['webscrapetools_store_add_seconds']['count'])
+        self.assertEqual(20, values['webscrapetools_store_retrieve_seconds']['count'])
+        self.assertEqual(0, values['webscrapetools_store_rebalance_seconds']['count'])
+        self.assertGreater(values['webscrapetools_store_lock_wait_seconds']['count'], 0)
+
+    def test_taskpool_metrics(self):
+        metrics.reset_metrics()
+        tasks = TaskPool(3)
+        for count in range(10):
+            tasks.add_task(lambda value: value * 2, count)
+
+        self.assertEqual(10, metrics.snapshot()['webscrapetools_taskpool_queue_depth'])
+        self.assertListEqual([count * 2 for count in range(10)], list(tasks.execute()))
+        values = metrics.snapshot()
+        self.assertEqual(0, values['webscrapetools_taskpool_queue_depth'])
+        self.assertEqual(10, values['webscrapetools_taskpool_task_seconds']['count'])
+
+        # tasks never executed are not left in the queue depth
+        tasks = TaskPool(1)
+        for count in range(10):
+            tasks.add_task(lambda value: value * 2, count)
+
+        results = tasks.execute()
+        self.assertEqual(0, next(results))
+        results.close()
+        self.assertEqual(0, metrics.snapshot()['webscrapetools_taskpool_queue_depth'])
+        tasks = TaskPool(3)
+        tasks.add_task(lambda value: value * 2, 0)
+        del tasks
+        self.assertEqual(0, metrics.snapshot()['webscrapetools_taskpool_queue_depth'])
+
+    def tearDown(self):
+        empty_cache()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    unittest.main()
@@ -0,0 +1,389 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+import unittest
+from datetime import datetime, timedelta
+
+import webscrapetools
+from webscrapetools.keyvalue import set_store_path, add_to_store, retrieve_from_store, remove_from_store, list_keys, \
+    empty_store, has_store_key, has_store_keys, get_store_id, invalidate_expired_entries, verify_store, rebuild_store, \
+    remove_from_store_multiple, export_store, import_store, retrieve_fresh_from_store
+from webscrapetools.osaccess import gen_directories_under
+from webscrapetools.storage import MemoryBackend, create_backend
+
+
+class TestStorageBackends(unittest.TestCase):
+
+    _STORE_PATHS = {
+        'filesystem': './output/tests',
+        'memory': 'tests',
+        'sqlite': './output/tests-store.sqlite',
+    }
+
+    def _check_backend(self, backend):
+        set_store_path(self._STORE_PATHS[backend], max_node_files=10, rebalancing_limit=30, backend=backend)
+        empty_store()
+        for count in range(100):
+            add_to_store('value ' + str(count), bytes(str(count), 'utf-8'))
+
+        add_to_store('value 42', b'updated')
+        self.assertEqual(b'updated', retrieve_from_store('value 42'))
+        self.assertTrue(has_store_key('value 30'))
+        remove_from_store('value 30')
+        self.assertFalse(has_store_key('value 30'))
+        self.assertListEqual([True, False, True, False], has_store_keys(['value 1', 'value 30', 'value 99', 'other']))
+        self.assertIsNone(retrieve_from_store('value 30'))
+        with self.assertRaises(KeyError):
+            retrieve_from_store('value 30', fail_on_missing=True)
+
+        expected_keys = sorted('value ' + str(count) for count in range(100) if count != 30)
+        self.assertListEqual(expected_keys, list_keys())
+
+        store = create_backend(backend, self._STORE_PATHS[backend])
+        self.assertIsNone(store.load_meta('journal'))
+        for count in range(3):
+            store.append_meta('journal', '{}\n'.format(count).encode('utf-8'))
+
+        self.assertEqual(b'0\n1\n2\n', store.load_meta('journal'))
+        store.save_meta('journal', b'3\n')
+        store.append_meta('journal', b'4\n')
+        self.assertEqual(b'3\n4\n', store.load_meta('journal'))
+        store.close()
+
+        set_store_path(self._STORE_PATHS[backend], expiry_days=3, backend=backend)
+        invalidate_expired_entries(as_of_date=datetime.today() + timedelta(days=10))
+        self.assertListEqual([], list_keys())
+        self.assertFalse(has_store_key('value 42'))
+        empty_store()
+
+    def test_filesystem_backend(self):
+        self._check_backend('filesystem')
+
+    def test_memory_backend(self):
+        self._check_backend('memory')
+
+    def test_sqlite_backend(self):
+        self._check_backend('sqlite')
+        self.assertTrue(os.path.isfile(self._STORE_PATHS['sqlite']))
+        self.assertEqual(os.path.abspath(self._STORE_PATHS['sqlite']) + '#bc4e44260919ea00a59f7a9dc75e73e3',
+                         get_store_id('my content'))
+
+    def test_backend_instance(self):
+        backend = MemoryBackend('instance')
+        set_store_path('ignored', backend=backend)
+        add_to_store('abc', b'def')
+        self.assertEqual(b'def', backend.load_value('e41225f8921fffcead7a35a3ddabdeeb'))
+        self.assertListEqual([('e41225f8921fffcead7a35a3ddabdeeb', 'abc')],
+                             [(digest, key) for _, digest, key in backend.iter_index()])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_backend('unknown', './output/tests')
+
+    def _check_content_addressed(self, backend):
+        set_store_path(self._STORE_PATHS[backend], max_node_files=10, rebalancing_limit=30, backend=backend,
+                       content_addressed=True)
+        empty_store()
+        for count in range(50):
+            add_to_store('key ' + str(count), bytes('value ' + str(count % 5), 'utf-8'))
+
+        self.assertEqual(b'value 3', retrieve_from_store('key 13'))
+        stored_digests, _ = create_backend(backend, self._STORE_PATHS[backend]).scan_values()
+        self.assertEqual(55, len(stored_digests))
+
+        add_to_store('key 0', b'value 9')
+        self.assertEqual(b'value 9', retrieve_from_store('key 0'))
+        remove_from_store_multiple(['key ' + str(count) for count in range(0, 50, 5)])
+        self.assertIsNone(retrieve_from_store('key 10'))
+        stored_digests, _ = create_backend(backend, self._STORE_PATHS[backend]).scan_values()
+        self.assertEqual(44, len(stored_digests))
+        self.assertTrue(all(len(digests) == 0 for digests in verify_store().values()))
+
+        # mode is kept by the store
+        set_store_path(self._STORE_PATHS[backend], backend=backend)
+        self.assertEqual(b'value 2', retrieve_from_store('key 12'))
+        with self.assertRaises(ValueError):
+            set_store_path(self._STORE_PATHS[backend], backend=backend, content_addressed=False)
+
+        empty_store()
+        set_store_path(self._STORE_PATHS[backend], backend=backend, content_addressed=False)
+        add_to_store('key', b'value')
+        stored_digests, _ = create_backend(backend, self._STORE_PATHS[backend]).scan_values()
+        self.assertEqual(1, len(stored_digests))
+        empty_store()
+
+    def test_content_addressed(self):
+        for backend in ('filesystem', 'memory', 'sqlite'):
+            self._check_content_addressed(backend)
+
+    def test_index_snapshot(self):
+        set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30)
+        empty_store()
+        for count in range(40):
+            add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+        backend = create_backend('filesystem', './output/tests')
+        self.assertEqual(30, json.loads(backend.load_meta('snapshot').decode('utf-8'))['count'])
+
+        # only entries added after the snapshot are read when reopening the store
+        set_store_path('./output/tests', expiry_days=3)
+        snapshot = json.loads(backend.load_meta('snapshot').decode('utf-8'))
+        self.assertEqual(40, snapshot['count'])
+        self.assertEqual(40, sum(snapshot['dates'].values()))
+        self.assertTrue(has_store_key('35'))
+
+        # snapshot no longer matching the index
+        backend.save_index(list(backend.iter_index())[5:])
+        set_store_path('./output/tests')
+        self.assertEqual(35, json.loads(backend.load_meta('snapshot').decode('utf-8'))['count'])
+        self.assertEqual(35, len(list_keys()))
+        self.assertFalse(has_store_key('0'))
+
+    def test_export_import(self):
+        set_store_path(self._STORE_PATHS['filesystem'], max_node_files=10, rebalancing_limit=30)
+        empty_store()
+        for count in range(100):
+            add_to_store('value ' + str(count), bytes(str(count), 'utf-8'))
+
+        for compression in (None, 'gzip', 'bz2', 'lzma'):
+            archive_path = './output/tests-export.archive'
+            self.assertEqual(100, export_store(archive_path, compression=compression))
+            for backend in ('filesystem', 'memory', 'sqlite'):
+                target_path = self._STORE_PATHS[backend] + '-import'
+                set_store_path(target_path, max_node_files=10, rebalancing_limit=30, backend=backend)
+                empty_store()
+                add_to_store('value 5', b'previous')
+                add_to_store('other', b'other')
+                self.assertEqual(100, import_store(archive_path))
+                self.assertEqual(b'5', retrieve_from_store('value 5'))
+                self.assertEqual(b'other', retrieve_from_store('other'))
+                self.assertEqual(101, len(list_keys()))
+                self.assertTrue(all(len(digests) == 0 for digests in verify_store().values()))
+                empty_store()
+
+            os.remove(archive_path)
+            set_store_path(self._STORE_PATHS['filesystem'])
+
+        # entries already in store not made older by the archive dates
+        export_store(archive_path)
+        set_store_path(self._STORE_PATHS['memory'] + '-import', backend='memory', expiry_periods=3600,
+                       expiry_unit='second', stale_periods=86400)
+        empty_store()
+        add_to_store('value 5', b'previous')
+        import_store(archive_path)
+        self.assertEqual((b'5', False), retrieve_fresh_from_store('value 5'))
+        empty_store()
+        os.remove(archive_path)
+
+        with self.assertRaises(ValueError):
+            export_store('./output/tests-export.archive', compression='unknown')
+
+    def test_key_hash(self):
+        set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30, key_hash='blake2b')
+        empty_store()
+        for count in range(100):
+            add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+        digest = hashlib.blake2b(repr('10').encode('utf-8'), digest_size=16).hexdigest()
+        self.assertEqual(digest, os.path.basename(get_store_id('10')))
+        self.assertTrue(all(len(node) == 32 for node in gen_directories_under('./output/tests')))
+
+        # hash is kept by the store
+        set_store_path('./output/tests')
+        self.assertEqual(b'10', retrieve_from_store('10'))
+        with self.assertRaises(ValueError):
+            set_store_path('./output/tests', key_hash='md5')
+
+        export_store('./output/tests-export.archive')
+        set_store_path(self._STORE_PATHS['memory'], backend='memory')
+        with self.assertRaises(ValueError):
+            import_store('./output/tests-export.archive')
+
+        os.remove('./output/tests-export.archive')
+        with self.assertRaises(ValueError):
+            set_store_path(self._STORE_PATHS['memory'], backend='memory', key_hash='unknown')
+
+        set_store_path('./output/tests')
+        empty_store()
+        set_store_path('./output/tests', key_hash='md5')
+
+    @unittest.skipUnless(importlib.util.find_spec('xxhash'), 'requires xxhash')
+    def test_key_hash_xxh128(self):
+        import xxhash
+        set_store_path(self._STORE_PATHS['memory'], backend='memory', key_hash='xxh128')
+        empty_store()
+        add_to_store('key', b'value')
+        self.assertEqual(xxhash.xxh3_128_hexdigest(repr('key').encode('utf-8')),
+                         get_store_id('key').split('#')[-1])
+        empty_store()
+        set_store_path(self._STORE_PATHS['memory'], backend='memory', key_hash='md5')
+
+    def test_eviction(self):
+        set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30, max_entries=50)
+        empty_store()
+        for count in range(50):
+            add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+        for count in range(10):
+            retrieve_from_store(str(count))
+
+        # coldest entries evicted in a single batch
+        add_to_store('50', b'50')
+        self.assertEqual(45, len(list_keys()))
+        self.assertTrue(all(has_store_key(str(count)) for count in range(10)))
+        self.assertFalse(has_store_key('10'))
+        self.assertTrue(has_store_key('50'))
+
+        # statistics are kept when reopening the store
+        set_store_path('./output/tests', max_entries=20, eviction_policy='lfu')
+        self.assertEqual(18, len(list_keys()))
+        self.assertTrue(all(has_store_key(str(count)) for count in range(10)))
+
+        set_store_path('./output/tests', max_bytes=20)
+        self.assertLessEqual(sum(len(retrieve_from_store(key)) for key in list_keys()), 18)
+        with self.assertRaises(ValueError):
+            set_store_path('./output/tests', eviction_policy='unknown')
+
+    def _run_process(self, code: str) -> str:
+        # store released first, not to be overwritten with the state of this process
+        set_store_path(self._STORE_PATHS['memory'], backend='memory')
+        source_path = os.path.dirname(os.path.dirname(os.path.abspath(webscrapetools.__file__)))
+        environment = dict(os.environ, PYTHONPATH=source_path)
+        process = subprocess.run([sys.executable, '-c', textwrap.dedent(code)], env=environment, check=True,
+                                 stderr=subprocess.PIPE)
+        return process.stderr.decode('utf-8')
+
+    def test_eviction_restart(self):
+        set_store_path('./output/tests')
+        empty_store()
+
+        # hits counted since the last save are persisted on exit
+        self._run_process('''
+            from webscrapetools.keyvalue import set_store_path, add_to_store, retrieve_from_store
+            set_store_path('./output/tests', max_node_files=10, rebalancing_limit=200, max_entries=1000)
+            for count in range(50):
+                add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+            for _ in range(5):
+                for count in range(10):
+                    retrieve_from_store(str(count))
+            ''')
+        set_store_path('./output/tests', max_entries=20, eviction_policy='lfu')
+        self.assertEqual(18, len(list_keys()))
+        self.assertTrue(all(has_store_key(str(count)) for count in range(10)))
+        empty_store()
+
+        # entries added after the last save are not older than the ones it accounts for
+        self._run_process('''
+            import os
+            from webscrapetools.keyvalue import set_store_path, add_to_store
+            set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30)
+            for count in range(50):
+                add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+            os._exit(0)
+            ''')
+        set_store_path('./output/tests', max_entries=20)
+        self.assertEqual(18, len(list_keys()))
+        self.assertFalse(any(has_store_key(str(count)) for count in range(30)))
+        empty_store()
+
+        # hits journaled periodically survive a process exiting without saving the store state
+        self._run_process('''
+            import os
+            from webscrapetools.keyvalue import set_store_path, add_to_store, retrieve_from_store
+            set_store_path('./output/tests', max_node_files=10, rebalancing_limit=20, max_entries=1000)
+            for count in range(50):
+                add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+            for _ in range(5):
+                for count in range(10):
+                    retrieve_from_store(str(count))
+
+            os._exit(0)
+            ''')
+        set_store_path('./output/tests', max_entries=20, eviction_policy='lfu')
+        self.assertEqual(18, len(list_keys()))
+        self.assertTrue(all(has_store_key(str(count)) for count in range(10)))
+        empty_store()
+
+        # store removed before the process exits
+        errors = self._run_process('''
+            import shutil
+            from webscrapetools.keyvalue import set_store_path, add_to_store, retrieve_from_store
+            set_store_path('./output/tests', max_entries=1000)
+            add_to_store('0', b'0')
+            retrieve_from_store('0')
+            shutil.rmtree('./output/tests')
+            ''')
+        self.assertNotIn('Traceback', errors)
+
+    def test_untracked_access(self):
+        set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30)
+        empty_store()
+        for count in range(60):
+            add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+        # no access statistics without quota nor stale period, overwrites not saving the index state again
+        backend = create_backend('filesystem', './output/tests')
+        snapshot = backend.load_meta('snapshot')
+        for count in range(60):
+            add_to_store(str(count), b'updated')
+            self.assertEqual(b'updated', retrieve_from_store(str(count)))
+
+        self.assertEqual(snapshot, backend.load_meta('snapshot'))
+        self.assertIsNone(backend.load_meta('access'))
+        self.assertIsNone(backend.load_meta('access-journal'))
+        backend.close()
+        empty_store()
+
+    def test_verify_store(self):
+        set_store_path('./output/tests', max_node_files=10, rebalancing_limit=30)
+        empty_store()
+        for count in range(100):
+            add_to_store(str(count), bytes(str(count), 'utf-8'))
+
+        report = verify_store()
+        self.assertTrue(all(len(digests) == 0 for digests in report.values()))
+
+        missing_file = get_store_id('10')
+        os.remove(missing_file)
+        orphan_file = get_store_id('orphan')
+        with open(orphan_file, 'wb') as orphan:
+            orphan.write(b'orphan')
+
+        misplaced_file = get_store_id('20')
+        first_node = os.path.join('./output/tests', gen_directories_under('./output/tests')[0])
+        if os.path.dirname(misplaced_file) == os.path.abspath(first_node):
+            first_node = os.path.join('./output/tests', gen_directories_under('./output/tests')[1])
+
+        shutil.move(misplaced_file, first_node)
+
+        report = verify_store(pool_size=4)
+        self.assertListEqual([os.path.basename(missing_file)], report['missing_values'])
+        self.assertListEqual([os.path.basename(orphan_file)], report['orphan_values'])
+        self.assertListEqual([os.path.basename(misplaced_file)], report['misplaced_values'])
+        self.assertEqual(100, len(list_keys()))
+
+        rebuild_store(pool_size=4)
+        report = verify_store()
+        self.assertTrue(all(len(digests) == 0 for digests in report.values()))
+        self.assertEqual(99, len(list_keys()))
+        self.assertFalse(has_store_key('10'))
+        self.assertEqual(b'20', retrieve_from_store('20'))
+        self.assertFalse(os.path.exists(orphan_file))
+
+    def tearDown(self):
+        set_store_path('./output/tests')
+        empty_store()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    unittest.main()